@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'authentication',
     'services.games',
     'services.tracking',
+    'services.boards',
     
     'django.contrib.admin',
     'django.contrib.auth',
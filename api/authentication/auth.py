@@ -1,5 +1,7 @@
 from ninja.security import HttpBearer
 from ninja.errors import HttpError
+from django.utils.timezone import now as tznow
+from . import settings
 from .utility import decode_token
 from services.users.models import User
 
@@ -7,6 +9,10 @@ class TokenAuthentication(HttpBearer):
     def authenticate(self, request, token: str):
         payload = decode_token(token)
         if payload and payload["user"] and payload["type"] == "access":
-            return payload["user"]
+            user = payload["user"]
+            if not user.last_seen or user.last_seen < tznow() - settings.LAST_SEEN_RESOLUTION:
+                user.last_seen = tznow()
+                User.objects.filter(id=user.id).update(last_seen=user.last_seen)
+            return user
         else:
             return None
@@ -7,5 +7,9 @@ AUTH_FLOW_EXPIRATION = timedelta(minutes=3)
 ACCESS_TOKEN_EXPIRATION = timedelta(minutes=30)
 REFRESH_TOKEN_EXPIRATION = timedelta(days=60)
 
+# Activity options
+# How often an authenticated user's last_seen is written
+LAST_SEEN_RESOLUTION = timedelta(minutes=5)
+
 # Logic options
 LOGIN_AFTER_REGISTRATION = False
\ No newline at end of file
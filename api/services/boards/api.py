@@ -1,4 +1,42 @@
 from ninja import Router
+from django.shortcuts import get_object_or_404
+from utils.schemas import ErrorOut
+from services.users.models import User
+from .models import StatBoard
+from .schemas import RankSchema
+from .ranking import top, page, around
+from . import settings
 
 router = Router()
 
+
+
+# STAT BOARD LEADERBOARDS
+
+# Best players of a board
+@router.get("/stat/{board_id}/top", response={200: list[RankSchema], 404: ErrorOut})
+def stat_board_top(request, board_id: int, limit: int = settings.LEADERBOARD_TOP, platform: int = None):
+    board = get_object_or_404(StatBoard, id=board_id)
+    return top(board, min(max(limit, 1), settings.LEADERBOARD_MAX), platform)
+
+
+# Page of a board by rank
+@router.get("/stat/{board_id}/ranks", response={200: list[RankSchema], 404: ErrorOut})
+def stat_board_page(request, board_id: int, page_number: int = 1, page_size: int = settings.LEADERBOARD_TOP, platform: int = None):
+    board = get_object_or_404(StatBoard, id=board_id)
+    return page(board, page_number, min(max(page_size, 1), settings.LEADERBOARD_MAX), platform)
+
+
+# Players ranked around a user
+@router.get("/stat/{board_id}/around/{user_id}", response={200: list[RankSchema], 404: ErrorOut})
+def stat_board_around(request, board_id: int, user_id: int, size: int = settings.LEADERBOARD_AROUND, platform: int = None):
+    board = get_object_or_404(StatBoard, id=board_id)
+    if user_id:
+        user = get_object_or_404(User, id=user_id)
+    else:
+        user = request.auth
+
+    ranks = around(board, user, min(max(size, 0), settings.LEADERBOARD_MAX), platform)
+    if ranks is None:
+        return 404, {"message": "User is not ranked on this board."}
+    return ranks
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class BoardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'boards'
+    name = 'services.boards'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now as tznow
+from services.boards.models import StatBoard, AchievementBoard, CompletionBoard
+from services.boards.refresh import refresh_boards
+
+
+class Command(BaseCommand):
+    help = 'Refresh every expired board, fetching each shared player once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Boards of each kind refreshed in this cycle')
+
+    def handle(self, *args, **options):
+        now = tznow()
+        boards = []
+        for model in (StatBoard, AchievementBoard, CompletionBoard):
+            boards += list(model.objects.filter(refresh__lt=now).order_by('refresh')[:options['limit']])
+
+        calls = refresh_boards(boards)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(boards)} boards with {calls} upstream calls"))
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0013_instanceschema'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AchievementBoard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=550)),
+                ('refresh', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('password', models.CharField(blank=True, max_length=255, null=True)),
+                ('achievements', models.ManyToManyField(blank=True, related_name='achievementboards', to='tracking.achievement')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='achievementboards', to='games.game')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CompletionBoard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=550)),
+                ('refresh', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('password', models.CharField(blank=True, max_length=255, null=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completionboards', to='games.game')),
+                ('instances', models.ManyToManyField(blank=True, related_name='completionboards', to='games.gameinstance')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatBoard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=550)),
+                ('statname', models.CharField(max_length=255)),
+                ('refresh', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('password', models.CharField(blank=True, max_length=255, null=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statboards', to='games.game')),
+                ('stats', models.ManyToManyField(blank=True, related_name='statboards', to='tracking.stat')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AchievementBoardPlayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='boards.achievementboard')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.platform')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('board', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CompletionBoardPlayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='players', to='boards.completionboard')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.platform')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('board', 'user', 'platform')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StatBoardPlayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='boards.statboard')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.platform')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('board', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+# Fill the stored platforms of existing boards from their stats, achievements and instances
+def sync_platforms(apps, schema_editor):
+    for model_name, relation, path in [
+        ('StatBoard', 'stats', 'stats__instance__platform_id'),
+        ('AchievementBoard', 'achievements', 'achievements__instance__platform_id'),
+        ('CompletionBoard', 'instances', 'instances__platform_id'),
+    ]:
+        model = apps.get_model('boards', model_name)
+        platforms = {}
+        for board_id, platform_id in model.objects.filter(**{f"{relation}__isnull": False}).values_list('id', path):
+            platforms.setdefault(board_id, set()).add(platform_id)
+        for board_id, ids in platforms.items():
+            model.objects.filter(id=board_id).update(platforms=sorted(ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievementboard',
+            name='platforms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='completionboard',
+            name='platforms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='statboard',
+            name='platforms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(sync_platforms, migrations.RunPython.noop),
+    ]
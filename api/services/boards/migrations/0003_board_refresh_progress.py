@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0002_board_platforms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievementboard',
+            name='refresh_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='completionboard',
+            name='refresh_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='statboard',
+            name='refresh_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,12 @@
 from django.db import models
 from services.games.models import Game, Platform, GameInstance
+from services.games.reference import platforms
 from services.users.models import User
-from services.tracking.models import Stat, StatValue, Achievement, AchievementStatus, InstanceCompletion
+from services.tracking.models import Stat, Achievement
 from django.utils.timezone import now as tznow
-from datetime import timedelta
 from django.contrib.auth.hashers import make_password, check_password
 from django.db import transaction
+from .refresh import refresh_rows, stat_value_rows, achievement_status_rows, completion_rows, begin_refresh, pending, finish_refresh
 
 
 # Stat Boards
@@ -14,14 +15,16 @@ class StatBoard(models.Model):
     name = models.CharField(max_length=550)
     statname = models.CharField(max_length=255)
     stats = models.ManyToManyField(Stat, related_name="statboards", blank=True)
+    platforms = models.JSONField(default=list, blank=True)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
+    refresh_started = models.DateTimeField(blank=True, null=True)
     password = models.CharField(max_length=255, blank=True, null=True)  
 
     def join(self, user, platform, password=None):
         if self.password and not check_password(password, self.password):
             return False  
 
-        if platform not in [stat.instance.platform for stat in self.stats.all()]:
+        if platform.id not in self.platforms:
             return False 
 
         player, created = StatBoardPlayer.objects.get_or_create(board=self, user=user, platform=platform)
@@ -30,22 +33,27 @@ class StatBoard(models.Model):
     def leave(self, user):
         return StatBoardPlayer.objects.filter(board=self, user=user).delete()[0] > 0 
 
+    # Store the platforms of the board's stats, kept in sync by the m2m signals
+    def sync_platforms(self):
+        self.platforms = sorted(set(self.stats.values_list('instance__platform_id', flat=True)))
+        StatBoard.objects.filter(id=self.id).update(platforms=self.platforms)
+
     def expired(self):
         return self.refresh < tznow()  
 
-    def update(self):
-        self.refresh = tznow() + timedelta(minutes=15)  
-
+    # Tracking rows of the board's players, by refresh_rows argument
+    def tracked(self):
         players = StatBoardPlayer.objects.filter(board=self)
-        for player in players:
-            for stat in self.stats.all():
-                if player.platform == stat.instance.platform:
-                    statv, created = StatValue.objects.get_or_create(stat=stat, user=player.user)
-                    statv.update() 
-        self.save()
+        stats = list(self.stats.select_related('instance'))
+        return {'statvs': stat_value_rows([(stat, player.user_id) for player in players for stat in stats if player.platform_id == stat.instance.platform_id])}
+
+    def update(self):
+        cutoff = begin_refresh(self)
+        refresh_rows(**{name: pending(rows, cutoff) for name, rows in self.tracked().items()}, cutoff=cutoff)
+        finish_refresh(self)
 
     def __str__(self):
-        return f"{self.name} - ({self.game.name}): {[stat.instance.platform.name for stat in self.stats.all()]}"
+        return f"{self.name} - ({self.game.name}): {[platform.name for platform in platforms.in_bulk(self.platforms).values()]}"
 
     @classmethod
     def create(cls, name, game, statname, stats, password=None):
@@ -89,14 +97,16 @@ class AchievementBoard(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="achievementboards")
     name = models.CharField(max_length=550)
     achievements = models.ManyToManyField(Achievement, related_name="achievementboards", blank=True)
+    platforms = models.JSONField(default=list, blank=True)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
+    refresh_started = models.DateTimeField(blank=True, null=True)
     password = models.CharField(max_length=255, blank=True, null=True)  
 
     def join(self, user, platform, password=None):
         if self.password and not check_password(password, self.password):
             return False  
 
-        if platform not in [ach.instance.platform for ach in self.achievements.all()]:
+        if platform.id not in self.platforms:
             return False  
 
         with transaction.atomic():
@@ -106,24 +116,26 @@ class AchievementBoard(models.Model):
     def leave(self, user):
         return AchievementBoardPlayer.objects.filter(board=self, user=user).delete()[0] > 0 
 
+    # Store the platforms of the board's achievements, kept in sync by the m2m signals
+    def sync_platforms(self):
+        self.platforms = sorted(set(self.achievements.values_list('instance__platform_id', flat=True)))
+        AchievementBoard.objects.filter(id=self.id).update(platforms=self.platforms)
+
     def expired(self):
         return self.refresh < tznow() 
     
-    def update(self):
-        self.refresh = tznow() + timedelta(minutes=15)  
+    def tracked(self):
+        players = AchievementBoardPlayer.objects.filter(board=self)
+        achievements = list(self.achievements.select_related('instance'))
+        return {'achvs': achievement_status_rows([(ach, player.user_id) for player in players for ach in achievements if player.platform_id == ach.instance.platform_id])}
 
-        with transaction.atomic():
-            self.save()
-
-            players = AchievementBoardPlayer.objects.filter(board=self)
-            for player in players:
-                for achievement in self.achievements.all():
-                    if player.platform == achievement.instance.platform:
-                        status, created = AchievementStatus.objects.get_or_create(achievement=achievement, user=player.user)
-                        status.update()
+    def update(self):
+        cutoff = begin_refresh(self)
+        refresh_rows(**{name: pending(rows, cutoff) for name, rows in self.tracked().items()}, cutoff=cutoff)
+        finish_refresh(self)
 
     def __str__(self):
-        return f"{self.name} - ({self.game.name}): {[ach.instance.platform.name for ach in self.achievements.all()]}"
+        return f"{self.name} - ({self.game.name}): {[platform.name for platform in platforms.in_bulk(self.platforms).values()]}"
 
     @classmethod
     def create(cls, name, game, achievements, password=None):
@@ -163,14 +175,16 @@ class CompletionBoard(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="completionboards")
     name = models.CharField(max_length=550)
     instances = models.ManyToManyField(GameInstance, related_name="completionboards", blank=True)
+    platforms = models.JSONField(default=list, blank=True)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
+    refresh_started = models.DateTimeField(blank=True, null=True)
     password = models.CharField(max_length=255, blank=True, null=True)
 
     def join(self, user, platform, password=None):
         if self.password and not check_password(password, self.password):
             return False
 
-        if not self.instances.filter(platform=platform).exists():
+        if platform.id not in self.platforms:
             return False
 
         player, created = CompletionBoardPlayer.objects.get_or_create(board=self, user=user, platform=platform)
@@ -179,21 +193,30 @@ class CompletionBoard(models.Model):
     def leave(self, user):
         return CompletionBoardPlayer.objects.filter(board=self, user=user).delete()[0] > 0
     
+    # Store the platforms of the board's instances, kept in sync by the m2m signals
+    def sync_platforms(self):
+        self.platforms = sorted(set(self.instances.values_list('platform_id', flat=True)))
+        CompletionBoard.objects.filter(id=self.id).update(platforms=self.platforms)
+
     def expired(self):
         return self.refresh < tznow()
 
-    def update(self):
-        self.refresh = tznow() + timedelta(minutes=15)
-        self.save()
+    def tracked(self):
+        players = CompletionBoardPlayer.objects.filter(board=self)
+        instances = list(self.instances.all())
+        achievements = list(Achievement.objects.filter(instance__in=instances).select_related('instance'))
+        return {
+            'achvs': achievement_status_rows([(ach, player.user_id) for player in players for ach in achievements if player.platform_id == ach.instance.platform_id]),
+            'completions': completion_rows([(instance, player.user_id) for player in players for instance in instances if player.platform_id == instance.platform_id]),
+        }
 
-        with transaction.atomic():
-            for player in CompletionBoardPlayer.objects.filter(board=self):
-                for instance in self.instances.filter(platform=player.platform):
-                    comp, created = InstanceCompletion.objects.get_or_create(instance=instance, user=player.user)
-                    comp.update()
+    def update(self):
+        cutoff = begin_refresh(self)
+        refresh_rows(**{name: pending(rows, cutoff) for name, rows in self.tracked().items()}, cutoff=cutoff)
+        finish_refresh(self)
 
     def __str__(self):
-        return f"{self.name} - ({self.game.name}): {[instance.platform.name for instance in self.instances.all()]}"
+        return f"{self.name} - ({self.game.name}): {[platform.name for platform in platforms.in_bulk(self.platforms).values()]}"
 
     @classmethod
     def create(cls, name, game, instances, password=None):
@@ -0,0 +1,145 @@
+import time
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+from .models import StatBoardPlayer
+from . import settings
+
+
+# Process-local rank cache
+# Hot stat boards keep their ranked rows as sorted arrays of (-value, -row id, user id) keys,
+# one over the whole board and one per platform, in the same order as the database
+# ranking. Reads are bisections with no queries, written stat values are applied as
+# they change and boards are rebuilt from the database when their membership or stats
+# change, after the TTL or when they were evicted under the entry cap.
+
+
+class BoardRanks:
+    def __init__(self, board_id, stats, players, rows):
+        self.board_id = board_id
+        self.built = time.monotonic()
+        self.stats = stats
+        self.players = players
+        self.keys = {None: []}
+        for platform_id in set(stats.values()):
+            self.keys[platform_id] = []
+        # Keys by row id, a player has one row per board stat of their platform
+        self.rows = {}
+        self.user_rows = defaultdict(set)
+        for row_id, user_id, value in rows:
+            self.add(row_id, user_id, (-value, -row_id, user_id))
+        for keys in self.keys.values():
+            keys.sort()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, row_id, user_id, key):
+        self.rows[row_id] = key
+        self.user_rows[user_id].add(row_id)
+        for platform_id in (None, self.players[user_id][1]):
+            self.keys[platform_id].append(key)
+
+    def expired(self):
+        return time.monotonic() - self.built > settings.RANK_CACHE_TTL
+
+    # Apply a written stat value of a board player
+    def update(self, row_id, user_id, stat_id, value):
+        if user_id not in self.players or self.stats.get(stat_id) != self.players[user_id][1]:
+            return
+
+        platform_id = self.players[user_id][1]
+        old = self.rows.pop(row_id, None)
+        if old is not None:
+            self.user_rows[user_id].discard(row_id)
+            for keys in (self.keys[None], self.keys[platform_id]):
+                del keys[bisect_left(keys, old)]
+
+        if value is not None:
+            key = (-value, -row_id, user_id)
+            self.rows[row_id] = key
+            self.user_rows[user_id].add(row_id)
+            insort(self.keys[None], key)
+            insort(self.keys[platform_id], key)
+
+    def entry(self, keys, key):
+        username, platform_id = self.players[key[2]]
+        return {"rank": bisect_left(keys, (key[0],)) + 1, "user_id": key[2], "value": -key[0], "username": username, "platform": platform_id}
+
+    def slice(self, platform_id, offset, limit):
+        keys = self.keys.get(platform_id, [])
+        return [self.entry(keys, key) for key in keys[offset:offset + limit]]
+
+    # Window around the best row of a user, like the database ranking
+    def around(self, user_id, size, platform_id):
+        rows = self.user_rows.get(user_id)
+        keys = self.keys.get(platform_id, [])
+        if not rows or (platform_id is not None and self.players[user_id][1] != platform_id):
+            return None
+        position = bisect_left(keys, min(self.rows[row_id] for row_id in rows))
+        offset = max(position - size, 0)
+        return self.slice(platform_id, offset, position - offset + size + 1)
+
+
+# Cached boards by id, least recently read first, and read counts of boards not cached
+# yet, the least recently read dropped past RANK_CACHE_MAX_TRACKED
+boards = OrderedDict()
+reads = OrderedDict()
+lock = threading.Lock()
+
+
+def build(board):
+    # Imported here as rankings read from this cache
+    from .ranking import stat_ranking
+
+    stats = dict(board.stats.values_list('id', 'instance__platform_id'))
+    players = {user_id: (username, platform_id) for user_id, username, platform_id in StatBoardPlayer.objects.filter(board=board).values_list('user_id', 'user__username', 'platform_id')}
+    rows = stat_ranking(board)
+    return BoardRanks(board.id, stats, players, rows.values_list('id', 'user_id', 'value').iterator())
+
+
+# Cached ranks of a board, built once it is hot and None while it is not
+def get(board):
+    if not settings.RANK_CACHE:
+        return None
+
+    with lock:
+        ranks = boards.get(board.id)
+        if ranks is not None and not ranks.expired():
+            boards.move_to_end(board.id)
+            return ranks
+
+        # Expired boards were hot already and are rebuilt straight away
+        if ranks is None:
+            now = time.monotonic()
+            started, count = reads.get(board.id, (now, 0))
+            if now - started > settings.RANK_CACHE_TTL:
+                started, count = now, 0
+            reads[board.id] = (started, count + 1)
+            reads.move_to_end(board.id)
+            while len(reads) > settings.RANK_CACHE_MAX_TRACKED:
+                reads.popitem(last=False)
+            if count + 1 < settings.RANK_CACHE_HOT_READS:
+                return None
+
+    ranks = build(board)
+    with lock:
+        boards[board.id] = ranks
+        reads.pop(board.id, None)
+        while sum(len(cached) for cached in boards.values()) > settings.RANK_CACHE_MAX_ENTRIES and len(boards) > 1:
+            boards.popitem(last=False)
+    return ranks
+
+
+# Drop a board so it is rebuilt on its next reads
+def discard(board_id):
+    with lock:
+        boards.pop(board_id, None)
+
+
+# Apply written stat values, (row id, user id, stat id, value) tuples, to the cached boards
+def apply(rows):
+    with lock:
+        for ranks in boards.values():
+            for row_id, user_id, stat_id, value in rows:
+                ranks.update(row_id, user_id, stat_id, value)
@@ -0,0 +1,71 @@
+from django.db.models import F, Q, Exists, OuterRef, Window
+from django.db.models.functions import Rank
+from services.tracking.models import StatValue
+from .models import StatBoardPlayer
+from . import rankcache
+
+
+# Stat board rankings
+# Players are ranked by the value of the board stat on the platform they joined on.
+# Ranks come from a window function read in (stat, value, id) index order, board
+# membership is checked per row so the top of a board is reached without sorting
+# every value. Boards over several platforms merge their stats with a sort, which
+# the per-platform view avoids. Players with equal values share a rank and the next
+# rank is skipped (1, 2, 2, 4), players on a shared rank are listed newest value row first.
+
+
+# Stat values of a board's players, optionally only those of one platform
+def stat_ranking(board, platform_id=None):
+    stats = board.stats.select_related('instance')
+    if platform_id:
+        stats = stats.filter(instance__platform_id=platform_id)
+
+    scope = Q(pk__in=[])
+    for stat in stats:
+        players = StatBoardPlayer.objects.filter(board=board, user=OuterRef('user_id'), platform_id=stat.instance.platform_id)
+        scope |= Q(Exists(players), stat=stat)
+    return StatValue.objects.filter(scope, value__isnull=False)
+
+
+# Ranked rows from `offset`, ties newest row first. The order is spelled out rather
+# than left to the scan order of the (stat, value, id) index, which the database may change
+def ranked(rows, offset, limit):
+    rows = rows.annotate(rank=Window(Rank(), order_by=F('value').desc())).order_by('-value', '-id')
+    return list(rows.values('rank', 'user_id', 'value', username=F('user__username'), platform=F('stat__instance__platform_id'))[offset:offset + limit])
+
+
+# Best `limit` players of a board, read from the rank cache once the board is hot
+def top(board, limit, platform_id=None):
+    ranks = rankcache.get(board)
+    if ranks is not None:
+        return ranks.slice(platform_id, 0, limit)
+
+    rows = stat_ranking(board, platform_id)
+    return ranked(rows, 0, limit)
+
+
+# One page of `size` players, pages start from 1
+def page(board, number, size, platform_id=None):
+    ranks = rankcache.get(board)
+    if ranks is not None:
+        return ranks.slice(platform_id, (max(number, 1) - 1) * size, size)
+
+    rows = stat_ranking(board, platform_id)
+    return ranked(rows, (max(number, 1) - 1) * size, size)
+
+
+# Up to `size` players on each side of a user, None when the user is not ranked on the board
+def around(board, user, size, platform_id=None):
+    ranks = rankcache.get(board)
+    if ranks is not None:
+        return ranks.around(user.id, size, platform_id)
+
+    rows = stat_ranking(board, platform_id)
+    # A user with several rows on the board is placed by their best one
+    own = rows.filter(user=user).order_by('-value', '-id').values('id', 'value').first()
+    if own is None:
+        return None
+
+    position = rows.filter(Q(value__gt=own['value']) | Q(value=own['value'], id__gt=own['id'])).count()
+    offset = max(position - size, 0)
+    return ranked(rows, offset, position - offset + size + 1)
@@ -0,0 +1,185 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import FloatField
+from django.utils.timezone import now as tznow
+from services.games.reference import platforms
+from services.users.models import Account
+from services.tracking.models import StatValue, Achievement, AchievementStatus, InstanceCompletion, GameCompletion
+from services.tracking.track import steam_snapshot
+from services.tracking.ingest import record_players, write_due, write_stat_values, write_statuses, back_off
+from services.tracking import settings as tracking_settings
+from . import settings
+
+
+# Board refresh engine
+# Board rows are grouped by (instance, account) so every player's snapshot is only
+# fetched once however many stats or achievements a board tracks. Fetches run on a
+# bounded thread pool and the results are written with one conditional update per model and batch.
+
+
+# Rows of a model for (item, user id) pairs, missing rows created
+def tracked_rows(model, field, pairs):
+    items = {item.id: item for item, user_id in pairs}
+    wanted = {(item.id, user_id) for item, user_id in pairs}
+    rows = model.objects.filter(**{f"{field}__in": items}, user__in={user_id for item, user_id in pairs})
+
+    existing = set(rows.values_list(f"{field}_id", "user_id"))
+    missing = [model(user_id=user_id, refresh=tznow(), **{field: items[item_id]}) for item_id, user_id in wanted - existing]
+    model.objects.bulk_create(missing, ignore_conflicts=True)
+
+    rows = [row for row in rows if (getattr(row, f"{field}_id"), row.user_id) in wanted]
+    for row in rows:
+        setattr(row, field, items[getattr(row, f"{field}_id")])
+    created = [row for row in rows if (getattr(row, f"{field}_id"), row.user_id) not in existing]
+    return rows, created
+
+def stat_value_rows(pairs):
+    rows, created = tracked_rows(StatValue, 'stat', pairs)
+    return rows
+
+def achievement_status_rows(pairs):
+    # Players are counted on an instance with their first achievement statuses for it
+    tracked = set(
+        AchievementStatus.objects.filter(achievement__instance__in={ach.instance_id for ach, user_id in pairs}, user__in={user_id for ach, user_id in pairs})
+        .values_list('achievement__instance_id', 'user_id').distinct()
+    )
+    record_players({(ach.instance_id, user_id) for ach, user_id in pairs} - tracked)
+    rows, created = tracked_rows(AchievementStatus, 'achievement', pairs)
+    return rows
+
+def completion_rows(pairs):
+    rows, created = tracked_rows(InstanceCompletion, 'instance', pairs)
+    GameCompletion.record([(comp.instance.game_id, None, comp.percentage or 0) for comp in created])
+    return rows
+
+
+# Board refresh progress
+# A board records when its refresh started and only clears it once every chunk is
+# written. Rows written since are skipped, so an interrupted refresh resumes where it stopped.
+def begin_refresh(board):
+    if board.refresh_started is None:
+        board.refresh_started = tznow()
+        type(board).objects.filter(id=board.id).update(refresh_started=board.refresh_started)
+    return board.refresh_started + tracking_settings.REFRESH_INTERVAL
+
+# Rows not yet written by the refresh started before `cutoff`, or due again since
+def pending(rows, cutoff):
+    return [row for row in rows if row.refresh < cutoff or row.expired()]
+
+def finish_refresh(board):
+    board.refresh = tznow() + settings.BOARD_REFRESH_INTERVAL
+    board.refresh_started = None
+    board.save(update_fields=['refresh', 'refresh_started'])
+
+
+# Fetch snapshots for (appid, steamid) keys, at most `concurrency` at a time
+def fetch_snapshots(keys, concurrency):
+    keys = list(keys)
+    if not keys:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(keys))) as executor:
+        return dict(zip(keys, executor.map(lambda key: steam_snapshot(*key), keys)))
+
+
+# Refresh stat values, achievement statuses and completions, returns the number of upstream fetches.
+# Snapshots are fetched and written `chunk_size` players at a time, each chunk in its own short
+# transaction, so an interrupted refresh keeps every chunk it finished
+def refresh_rows(statvs=(), achvs=(), completions=(), concurrency=settings.REFRESH_CONCURRENCY, chunk_size=settings.REFRESH_CHUNK_SIZE, cutoff=None):
+    # Rows are only written while due before the cutoff, a board refresh passes the one it started with
+    cutoff = max(cutoff, tznow()) if cutoff else tznow()
+
+    pairs = {(statv.stat.instance, statv.user_id) for statv in statvs}
+    pairs |= {(achv.achievement.instance, achv.user_id) for achv in achvs}
+    pairs |= {(comp.instance, comp.user_id) for comp in completions}
+    if not pairs:
+        return 0
+
+    steam = platforms.get(name="Steam")
+    accounts = dict(Account.objects.filter(user__in={user_id for instance, user_id in pairs}, platform=steam).values_list('user_id', 'uid'))
+
+    def key(instance, user_id):
+        if instance.platform_id == steam.id and user_id in accounts:
+            return (instance.uid, accounts[user_id])
+
+    # Rows grouped by the snapshot they are refreshed from
+    rows = defaultdict(lambda: ([], [], []))
+    for index, model_rows, instance_of in [
+        (0, statvs, lambda statv: statv.stat.instance),
+        (1, achvs, lambda achv: achv.achievement.instance),
+        (2, completions, lambda comp: comp.instance),
+    ]:
+        for row in model_rows:
+            row_key = key(instance_of(row), row.user_id)
+            if row_key is not None:
+                rows[row_key][index].append(row)
+
+    achievement_names = defaultdict(list)
+    for instance_id, name in Achievement.objects.filter(instance__in={comp.instance_id for comp in completions}).values_list('instance_id', 'name'):
+        achievement_names[instance_id].append(name)
+
+    keys = list(rows)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        snapshots = fetch_snapshots(chunk, concurrency)
+        back_off([row for chunk_key in chunk if snapshots[chunk_key] is None for model_rows in rows[chunk_key] for row in model_rows], cutoff)
+        write_chunk([(snapshots[chunk_key], rows[chunk_key]) for chunk_key in chunk if snapshots[chunk_key] is not None], achievement_names, cutoff)
+
+    return len(keys)
+
+
+# Apply fetched snapshots to their rows and write the ones still due before the cutoff in one transaction
+def write_chunk(fetched, achievement_names, cutoff):
+    refresh = tznow() + tracking_settings.REFRESH_INTERVAL
+
+    statvs_updated = []
+    achvs_updated = []
+    completions_updated = []
+    flipped = set()
+    previous = {}
+    for data, (statvs, achvs, completions) in fetched:
+        for statv in statvs:
+            statv.refresh = refresh
+            statv.value = data['stats'].get(statv.stat.name)
+            statvs_updated.append(statv)
+
+        for achv in achvs:
+            status = data['achievements'].get(achv.achievement.name, False)
+            if status != achv.status:
+                flipped.add(achv.id)
+            achv.refresh = refresh
+            achv.status = status
+            achvs_updated.append(achv)
+
+        for comp in completions:
+            names = achievement_names[comp.instance_id]
+            achieved = sum(1 for name in names if data['achievements'].get(name, False))
+            previous[comp.id] = comp.percentage or 0
+            comp.refresh = refresh
+            comp.percentage = (achieved / len(names)) * 100 if names else 0
+            completions_updated.append(comp)
+
+    with transaction.atomic():
+        write_stat_values(statvs_updated, cutoff, refresh)
+        write_statuses(achvs_updated, flipped, cutoff, refresh)
+        written = write_due(InstanceCompletion, completions_updated, 'percentage', FloatField(), cutoff, refresh)
+        GameCompletion.record([(comp.instance.game_id, previous[comp.id], comp.percentage) for comp in written])
+
+
+# Refresh coordinator
+# Players are often members of several boards of the same game. Expiring boards are
+# refreshed together - their rows are merged so every row is written once, rows that
+# are not due yet are skipped and each (instance, account) snapshot is fetched once.
+# Returns the number of upstream fetches.
+def refresh_boards(boards, concurrency=settings.REFRESH_CONCURRENCY):
+    due = {'statvs': {}, 'achvs': {}, 'completions': {}}
+    for board in boards:
+        for name, rows in board.tracked().items():
+            for row in rows:
+                if row.expired():
+                    due[name].setdefault(row.id, row)
+
+    calls = refresh_rows(**{name: list(rows.values()) for name, rows in due.items()}, concurrency=concurrency)
+    for board in boards:
+        finish_refresh(board)
+    return calls
@@ -0,0 +1,9 @@
+from ninja import Schema
+
+# Leaderboard schemas
+class RankSchema(Schema):
+    rank: int
+    user_id: int
+    username: str
+    platform: int
+    value: float
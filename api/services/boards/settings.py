@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+# Refresh options
+# Time between refreshes of a board's players
+BOARD_REFRESH_INTERVAL = timedelta(minutes=15)
+# Upper bound on concurrent upstream fetches while refreshing a board
+REFRESH_CONCURRENCY = 8
+# Players fetched and written per board refresh transaction
+REFRESH_CHUNK_SIZE = 25
+
+# Leaderboard options
+# Entries returned by default from the top of a board, and the most a single request can ask for
+LEADERBOARD_TOP = 10
+LEADERBOARD_MAX = 100
+# Entries on each side of a player for an "around me" window
+LEADERBOARD_AROUND = 5
+
+# Rank cache options
+# Keep sorted ranks of hot stat boards in process memory
+RANK_CACHE = True
+# Reads within the rank cache TTL before a board is considered hot and cached
+RANK_CACHE_HOT_READS = 10
+# Most boards whose reads are counted before they are hot, least recently read ones are forgotten
+RANK_CACHE_MAX_TRACKED = 10_000
+# Cached boards are rebuilt after this many seconds, bounding drift from writes in other processes
+RANK_CACHE_TTL = 300
+# Upper bound on ranked rows held across all cached boards, least recently read boards are evicted first
+RANK_CACHE_MAX_ENTRIES = 1_000_000
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from services.tracking.signals import stat_values_written
+from .models import StatBoard, StatBoardPlayer, AchievementBoard, CompletionBoard
+from . import rankcache
+
+# Boards of a stat, achievement or instance by board model
+BOARDS = {StatBoard: 'statboards', AchievementBoard: 'achievementboards', CompletionBoard: 'completionboards'}
+
+
+# Keep cached board ranks in step with written stat values
+@receiver(stat_values_written)
+def stat_values_changed(sender, rows, **kwargs):
+    rankcache.apply(rows)
+
+
+# Membership and stat changes rebuild the board's ranks on its next reads
+@receiver(post_save, sender=StatBoardPlayer)
+@receiver(post_delete, sender=StatBoardPlayer)
+def stat_board_player_changed(sender, instance, **kwargs):
+    rankcache.discard(instance.board_id)
+
+@receiver(m2m_changed, sender=StatBoard.stats.through)
+def stat_board_stats_changed(sender, instance, **kwargs):
+    if isinstance(instance, StatBoard):
+        rankcache.discard(instance.id)
+    else:
+        for board_id in StatBoard.objects.filter(stats=instance).values_list('id', flat=True):
+            rankcache.discard(board_id)
+
+@receiver(post_delete, sender=StatBoard)
+def stat_board_removed(sender, instance, **kwargs):
+    rankcache.discard(instance.id)
+
+
+# Stored board platforms follow the board's stats, achievements and instances from
+# whichever side of the relation they are changed
+@receiver(m2m_changed, sender=StatBoard.stats.through)
+@receiver(m2m_changed, sender=AchievementBoard.achievements.through)
+@receiver(m2m_changed, sender=CompletionBoard.instances.through)
+def board_items_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.sync_platforms()
+        return
+
+    if action == "pre_clear":
+        instance._cleared_boards = list(getattr(instance, BOARDS[model]).values_list('id', flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        board_ids = instance.__dict__.pop('_cleared_boards', []) if action == "post_clear" else pk_set
+        for board in model.objects.filter(id__in=board_ids):
+            board.sync_platforms()
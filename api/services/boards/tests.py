@@ -1,3 +1,297 @@
+from unittest import mock
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as tznow
+from services.games.models import Platform, Game, GameInstance
+from services.games.reference import platforms
+from services.users.models import User, Account
+from services.tracking.models import Stat, StatValue, Achievement, AchievementStatus, InstanceCompletion, InstanceCounter, GameCompletion
+from services.tracking.ingest import write_stat_values
+from .models import StatBoard, StatBoardPlayer, AchievementBoard, AchievementBoardPlayer, CompletionBoard, CompletionBoardPlayer
+from .refresh import refresh_rows, refresh_boards, stat_value_rows, achievement_status_rows, completion_rows, pending
+from . import rankcache, ranking, refresh, settings
 
-# Create your tests here.
+
+class RankingTestCase(TestCase):
+    def setUp(self):
+        rankcache.boards.clear()
+        rankcache.reads.clear()
+
+        steam = Platform.objects.create(name="Steam")
+        game = Game.objects.create(id=1, name="Game")
+        instance = GameInstance.objects.create(game=game, platform=steam, uid="1")
+        self.stats = [Stat.objects.create(name=f"stat{i}", instance=instance) for i in range(2)]
+        self.board = StatBoard.objects.create(game=game, name="Board", statname="stat")
+        self.board.stats.add(*self.stats)
+
+        self.users = [User.objects.create_user(username=f"user{i}", password="password") for i in range(4)]
+        for user in self.users:
+            StatBoardPlayer.objects.create(board=self.board, user=user, platform=steam)
+
+        # Every user has a row on both stats, several of them tied
+        for user, values in zip(self.users, [(5, 1), (3, 5), (5, 2), (4, None)]):
+            for stat, value in zip(self.stats, values):
+                StatValue.objects.create(user=user, stat=stat, value=value)
+
+    def database(self, method, *args, **kwargs):
+        with mock.patch.object(rankcache, "get", return_value=None):
+            return method(self.board, *args, **kwargs)
+
+
+# Ranks read straight from the database with the window function
+class RankingTest(RankingTestCase):
+    def ranks(self, entries):
+        return [(entry["rank"], entry["user_id"], entry["value"]) for entry in entries]
+
+    def test_top_orders_ties_newest_row_first(self):
+        users = [user.id for user in self.users]
+        self.assertEqual(self.ranks(self.database(ranking.top, 100)), [
+            (1, users[2], 5), (1, users[1], 5), (1, users[0], 5),
+            (4, users[3], 4), (5, users[1], 3), (6, users[2], 2), (7, users[0], 1),
+        ])
+        self.assertEqual(self.ranks(self.database(ranking.top, 2)), [(1, users[2], 5), (1, users[1], 5)])
+
+    def test_pages(self):
+        users = [user.id for user in self.users]
+        self.assertEqual(self.ranks(self.database(ranking.page, 2, 3)), [(4, users[3], 4), (5, users[1], 3), (6, users[2], 2)])
+        self.assertEqual(self.ranks(self.database(ranking.page, 3, 3)), [(7, users[0], 1)])
+        self.assertEqual(self.database(ranking.page, 4, 3), [])
+
+    def test_around_places_users_by_their_best_row(self):
+        users = [user.id for user in self.users]
+        self.assertEqual(self.ranks(self.database(ranking.around, self.users[3], 1)), [(1, users[0], 5), (4, users[3], 4), (5, users[1], 3)])
+        self.assertEqual(self.ranks(self.database(ranking.around, self.users[2], 1)), [(1, users[2], 5), (1, users[1], 5)])
+
+        outsider = User.objects.create(username="outsider")
+        self.assertIsNone(self.database(ranking.around, outsider, 1))
+
+    # Rows of players who left and of platforms a player did not join on are not ranked
+    def test_only_board_players_on_their_platform(self):
+        StatBoardPlayer.objects.filter(user=self.users[2]).delete()
+        other = Platform.objects.create(name="Other")
+        StatBoardPlayer.objects.filter(user=self.users[3]).update(platform=other)
+
+        users = {entry["user_id"] for entry in self.database(ranking.top, 100)}
+        self.assertEqual(users, {self.users[0].id, self.users[1].id})
+        self.assertEqual(self.database(ranking.top, 100, platform_id=other.id), [])
+
+
+class RankCacheTest(RankingTestCase):
+    def cached(self):
+        return rankcache.BoardRanks(self.board.id, *self.build_args())
+
+    def build_args(self):
+        stats = dict(self.board.stats.values_list("id", "instance__platform_id"))
+        players = {player.user_id: (player.user.username, player.platform_id) for player in StatBoardPlayer.objects.filter(board=self.board).select_related("user")}
+        rows = ranking.stat_ranking(self.board).values_list("id", "user_id", "value")
+        return stats, players, rows
+
+    def assertMatchesDatabase(self, ranks):
+        self.assertEqual(ranks.slice(None, 0, 100), self.database(ranking.top, 100))
+        for user in self.users:
+            self.assertEqual(ranks.around(user.id, 1, None), self.database(ranking.around, user, 1), user.username)
+
+    def test_rows_of_one_user_are_kept_apart(self):
+        ranks = self.cached()
+        self.assertEqual(len(ranks), 7)
+        self.assertEqual([entry["user_id"] for entry in ranks.slice(None, 0, 100)].count(self.users[0].id), 2)
+        self.assertMatchesDatabase(ranks)
+
+    def test_written_values_are_applied(self):
+        ranks = self.cached()
+        statvs = list(StatValue.objects.filter(user=self.users[0]))
+        for statv, value in zip(statvs, (0, None)):
+            statv.value = value
+
+        with mock.patch.object(rankcache, "boards", {self.board.id: ranks}):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_stat_values(statvs, tznow(), tznow())
+        self.assertMatchesDatabase(ranks)
+
+    # Values a conditional write skipped never reach the cache
+    def test_skipped_values_are_not_sent(self):
+        ranks = self.cached()
+        statvs = list(StatValue.objects.filter(user=self.users[0]))
+        for statv in statvs:
+            statv.value = 100
+
+        with mock.patch.object(rankcache, "boards", {self.board.id: ranks}):
+            with self.captureOnCommitCallbacks(execute=True):
+                written = write_stat_values(statvs, StatValue.objects.order_by("refresh").first().refresh, tznow())
+        self.assertEqual(written, [])
+        self.assertMatchesDatabase(ranks)
+
+    def test_read_counts_are_capped(self):
+        boards = [StatBoard.objects.create(game=self.board.game, name=f"Board {i}", statname="stat") for i in range(5)]
+        with mock.patch.object(settings, "RANK_CACHE_MAX_TRACKED", 3):
+            for board in boards:
+                self.assertIsNone(rankcache.get(board))
+        self.assertEqual(list(rankcache.reads), [board.id for board in boards[-3:]])
+
+
+class BoardRefreshTestCase(TestCase):
+    def setUp(self):
+        self.steam = Platform.objects.create(name="Steam")
+        self.game = Game.objects.create(id=1, name="Game")
+        self.instance = GameInstance.objects.create(game=self.game, platform=self.steam, uid="10")
+        self.stats = [Stat.objects.create(name=name, instance=self.instance) for name in ("kills", "deaths")]
+        self.achievements = [Achievement.objects.create(name=f"achievement{i}", instance=self.instance) for i in range(3)]
+
+        self.users = [User.objects.create(username=f"user{i}") for i in range(30)]
+        for user in self.users:
+            Account.objects.create(user=user, platform=self.steam, uid=str(user.id))
+
+    # Snapshot of a player, kills are their steam id and the first achievement is unlocked
+    def snapshot(self, appid, steamid):
+        return {"stats": {"kills": int(steamid)}, "achievements": {"achievement0": True}}
+
+    def fetching(self):
+        return mock.patch("services.boards.refresh.steam_snapshot", side_effect=self.snapshot)
+
+    def rows(self, users):
+        return {
+            "statvs": stat_value_rows([(stat, user.id) for user in users for stat in self.stats]),
+            "achvs": achievement_status_rows([(achievement, user.id) for user in users for achievement in self.achievements]),
+            "completions": completion_rows([(self.instance, user.id) for user in users]),
+        }
+
+
+class BoardRefreshTest(BoardRefreshTestCase):
+    # Every player's rows are refreshed from their one snapshot and written with one update
+    # per model, so a chunk of more players takes no more queries
+    def test_chunk_writes_take_a_fixed_number_of_queries(self):
+        # Platforms are read once per process
+        platforms.all()
+        queries = []
+        for users in (self.users[:2], self.users[2:25]):
+            rows = self.rows(users)
+            with self.fetching() as fetch, CaptureQueriesContext(connection) as captured:
+                self.assertEqual(refresh_rows(**rows), len(users))
+            self.assertEqual(fetch.call_count, len(users))
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+        values = dict(StatValue.objects.filter(stat=self.stats[0]).values_list("user_id", "value"))
+        self.assertEqual(values, {user.id: user.id for user in self.users[:25]})
+        self.assertFalse(StatValue.objects.filter(stat=self.stats[1], value__isnull=False).exists())
+        self.assertEqual(AchievementStatus.objects.filter(status=True).count(), 25)
+        self.assertAlmostEqual(InstanceCompletion.objects.get(user=self.users[0]).percentage, 100 / 3)
+
+        counter = InstanceCounter.objects.get(instance=self.instance)
+        self.assertEqual((counter.players, counter.unlocks), (25, 25))
+        rollup = GameCompletion.objects.get(game=self.game)
+        self.assertEqual(rollup.count, 25)
+        self.assertAlmostEqual(rollup.percentage, 100 / 3)
+
+    def test_rows_not_due_are_not_fetched(self):
+        rows = self.rows(self.users[:2])
+        with self.fetching():
+            refresh_rows(**rows)
+        with self.fetching() as fetch:
+            self.assertEqual(refresh_rows(**{name: pending(model_rows, tznow()) for name, model_rows in self.rows(self.users[:2]).items()}), 0)
+        self.assertEqual(fetch.call_count, 0)
+
+
+class BoardResumeTest(BoardRefreshTestCase):
+    def setUp(self):
+        super().setUp()
+        self.board = StatBoard.objects.create(game=self.game, name="Board", statname="kills")
+        self.board.stats.add(*self.stats)
+        for user in self.users:
+            StatBoardPlayer.objects.create(board=self.board, user=user, platform=self.steam)
+
+    # A refresh interrupted after its first chunk keeps it and the next one fetches the rest
+    def test_interrupted_refresh_resumes(self):
+        write_chunk = refresh.write_chunk
+        def interrupted(*args):
+            if StatValue.objects.filter(value__isnull=False).exists():
+                raise RuntimeError("interrupted")
+            return write_chunk(*args)
+
+        with self.fetching() as fetch, mock.patch("services.boards.refresh.write_chunk", side_effect=interrupted):
+            with self.assertRaises(RuntimeError):
+                self.board.update()
+        self.assertEqual(fetch.call_count, len(self.users))
+        self.assertEqual(StatValue.objects.filter(stat=self.stats[0], value__isnull=False).count(), settings.REFRESH_CHUNK_SIZE)
+        self.board.refresh_from_db()
+        self.assertIsNotNone(self.board.refresh_started)
+
+        with self.fetching() as fetch:
+            self.board.update()
+        self.assertEqual(fetch.call_count, len(self.users) - settings.REFRESH_CHUNK_SIZE)
+        self.assertEqual(StatValue.objects.filter(stat=self.stats[0], value__isnull=False).count(), len(self.users))
+        self.board.refresh_from_db()
+        self.assertIsNone(self.board.refresh_started)
+        self.assertFalse(self.board.expired())
+
+
+class RefreshBoardsTest(BoardRefreshTestCase):
+    # Boards of one game share their players, each player is fetched once for all of them
+    def test_boards_share_fetches(self):
+        players = self.users[:5]
+        stat_board = StatBoard.objects.create(game=self.game, name="Stats", statname="kills")
+        stat_board.stats.add(*self.stats)
+        achievement_board = AchievementBoard.objects.create(game=self.game, name="Achievements")
+        achievement_board.achievements.add(*self.achievements)
+        completion_board = CompletionBoard.objects.create(game=self.game, name="Completion")
+        completion_board.instances.add(self.instance)
+        for user in players:
+            StatBoardPlayer.objects.create(board=stat_board, user=user, platform=self.steam)
+            AchievementBoardPlayer.objects.create(board=achievement_board, user=user, platform=self.steam)
+            CompletionBoardPlayer.objects.create(board=completion_board, user=user, platform=self.steam)
+
+        boards = [stat_board, achievement_board, completion_board]
+        with self.fetching() as fetch:
+            self.assertEqual(refresh_boards(boards), len(players))
+        self.assertEqual(fetch.call_count, len(players))
+
+        self.assertEqual(StatValue.objects.filter(stat=self.stats[0], value__isnull=False).count(), len(players))
+        self.assertEqual(AchievementStatus.objects.filter(status=True).count(), len(players))
+        self.assertEqual(InstanceCompletion.objects.filter(percentage__gt=30).count(), len(players))
+        for board in boards:
+            board.refresh_from_db()
+            self.assertFalse(board.expired())
+
+        # Nothing is due again straight away
+        with self.fetching() as fetch:
+            self.assertEqual(refresh_boards(boards), 0)
+
+
+class BoardPlatformsTest(TestCase):
+    def setUp(self):
+        self.steam = Platform.objects.create(name="Steam")
+        self.other = Platform.objects.create(name="Other")
+        self.game = Game.objects.create(id=1, name="Game")
+        self.stats = [
+            Stat.objects.create(name="kills", instance=GameInstance.objects.create(game=self.game, platform=platform, uid=platform.name))
+            for platform in (self.steam, self.other)
+        ]
+        self.board = StatBoard.objects.create(game=self.game, name="Board", statname="kills")
+        self.user = User.objects.create(username="user")
+
+    def platforms(self):
+        return StatBoard.objects.get(id=self.board.id).platforms
+
+    def test_platforms_follow_board_stats(self):
+        self.board.stats.add(self.stats[0])
+        self.assertEqual(self.platforms(), [self.steam.id])
+        self.board.stats.add(self.stats[1])
+        self.assertEqual(self.platforms(), sorted([self.steam.id, self.other.id]))
+        self.board.stats.remove(self.stats[0])
+        self.assertEqual(self.platforms(), [self.other.id])
+        self.board.stats.clear()
+        self.assertEqual(self.platforms(), [])
+
+    # Changes from the stat's side of the relation update the board too
+    def test_reverse_changes(self):
+        self.stats[1].statboards.add(self.board)
+        self.assertEqual(self.platforms(), [self.other.id])
+        self.stats[1].statboards.clear()
+        self.assertEqual(self.platforms(), [])
+
+    def test_join_checks_stored_platforms(self):
+        self.board.stats.add(self.stats[0])
+        self.board.refresh_from_db()
+        self.assertFalse(self.board.join(self.user, self.other))
+        self.assertTrue(self.board.join(self.user, self.steam))
@@ -1,37 +1,70 @@
 from utils.schemas import ErrorOut
+from utils.batch import parse_ids
 from ninja import Router
 from ninja.pagination import paginate, PageNumberPagination
 from .models import Game, Platform, Company, Tag, GameInstance
-from .schemas import GameSchema, TagSchema, CompanySchema, PlatformSchema
-from django.db.models import Q
+from .schemas import GameSchema, TagSchema, CompanySchema, PlatformSchema, GameCursorSchema, GameSuggestSchema, PagedGameSchema, GameBatchSchema
+from django.db.models import Q, Case, When
+from .search import search as search_games, matching as search_matching
+from .filters import catalog_ids, GameList
+from .cursor import cursor_page, approximate_total, InvalidCursor
+from .cache import cached_response
+from .suggest import suggest
+from .reference import platforms, tags, companies
+from .projection import ProjectedPagination, game_rows, parse_fields, render
+from . import settings
 
 router = Router()
 
 # Game endpoints
-@router.get("", response=list[GameSchema])
-@paginate(PageNumberPagination, page_size=20)
+# Pages are rendered from projections, `fields` picks a sparse fieldset
+@router.get("", response=PagedGameSchema)
+@cached_response
+@paginate(ProjectedPagination, page_size=settings.LISTING_PAGE_SIZE)
 def all_games_with_search(request,     
     search: str = None,
     order: str = None,
     lth: bool = False,
     tags: str = None, 
-    companies: str = None):
+    companies: str = None,
+    match: str = "any",
+    fields: str = None):
 
-    query = Game.objects.prefetch_related("tags", "companies", "game_instances").all()
+    # Searches in relevance order are capped at SEARCH_LIMIT, searches in another
+    # order filter by every match
+    ranked = search_games(search) if search and not order else None
+    matched = search_matching(search) if search and order else None
 
-    if search:
-        query = query.filter(Q(name__icontains=search) | Q(aliases__icontains=search))
+    # Filtered through the catalog index, only the games of the page are fetched
+    if not search or ranked is not None or matched is not None:
+        ids = catalog_ids(ranked, order, lth, tags, companies, match, matched)
+        if ids is not None:
+            return GameList(ids)
 
-    if tags:
-        tags = [tag.strip() for tag in tags.split(',')]
-        query = query.filter(Q(tags__slug__in=tags) | Q(tags__name__in=tags))
+    query = Game.objects.prefetch_related("tags", "companies", "game_instances").all()
 
-    if companies:
-        companies = [company.strip() for company in companies.split(',')]
-        query = query.filter(Q(companies__slug__in=companies) | Q(companies__name__in=companies))
+    if search:
+        if ranked is not None:
+            query = query.filter(id__in=ranked)
+        elif matched is not None:
+            query = query.filter(id__in=matched)
+        else:
+            query = query.filter(Q(name__icontains=search) | Q(aliases__icontains=search))
+
+    for field, terms in [("tags", tags), ("companies", companies)]:
+        if terms:
+            terms = [term.strip() for term in terms.split(',')]
+            if match == "all":
+                for term in terms:
+                    query = query.filter(Q(**{f"{field}__slug": term}) | Q(**{f"{field}__name": term}))
+            else:
+                query = query.filter(Q(**{f"{field}__slug__in": terms}) | Q(**{f"{field}__name__in": terms}))
+    query = query.distinct()
 
     order_prefix = "" if lth else "-"
-    if order == "popularity":
+    if ranked and not order:
+        query = query.order_by(Case(*[When(id=game_id, then=position) for position, game_id in enumerate(ranked)]))
+    elif order == "popularity":
         query = query.order_by(f"{order_prefix}popularity")
     elif order == "name": 
         query = query.order_by(f"{order_prefix}name")
@@ -40,8 +73,53 @@ def all_games_with_search(request,
 
     return query
 
+# Game listing by cursor - stable pages in (popularity, id) or (name, id) order
+@router.get("/cursor", response={200: GameCursorSchema, 400: ErrorOut})
+@cached_response
+def games_by_cursor(request,
+    cursor: str = None,
+    size: int = settings.CURSOR_PAGE_SIZE,
+    order: str = None,
+    lth: bool = False,
+    tags: str = None,
+    companies: str = None,
+    match: str = "any",
+    total: bool = False,
+    fields: str = None):
+
+    try:
+        ids, next_cursor = cursor_page(order, lth, cursor, min(max(size, 1), settings.CURSOR_MAX_PAGE_SIZE), tags, companies, match)
+    except InvalidCursor as e:
+        return 400, {"message": str(e)}
+
+    return render({
+        "items": game_rows(ids, parse_fields(fields)),
+        "next": next_cursor,
+        "total": approximate_total(tags, companies, match) if total else None,
+    })
+
+# Typeahead suggestions from the in-memory prefix index. Not response cached,
+# the index answers faster than a cache read
+@router.get("/suggest", response=list[GameSuggestSchema])
+def suggest_games(request, q: str, limit: int = settings.SUGGEST_LIMIT):
+    return suggest(q, limit)
+
+# Several games at once in a fixed number of queries, ids not found are listed as missing
+@router.get("/batch", response={200: GameBatchSchema, 400: ErrorOut})
+@cached_response
+def games_batch(request, ids: str, fields: str = None):
+    try:
+        ids = parse_ids(ids, settings.BATCH_MAX_IDS)
+    except ValueError as e:
+        return 400, {"message": str(e)}
+
+    games = game_rows(ids, parse_fields(fields))
+    found = {game["id"] for game in games}
+    return render({"items": games, "missing": [game_id for game_id in ids if game_id not in found]})
+
 # Inidividual game endpoint
-@router.get("/{game_id}", response={200: GameSchema, 404: ErrorOut})
+@router.get("/{int:game_id}", response={200: GameSchema, 404: ErrorOut})
+@cached_response
 def game_by_id(request, game_id: int):
     try:
         game = Game.objects.prefetch_related("tags", "companies", "game_instances").get(id=game_id)
@@ -52,40 +130,46 @@ def game_by_id(request, game_id: int):
 
 # Other endpoints for specifc data if needed
 @router.get("/tags", response=list[TagSchema])
+@cached_response
 @paginate(PageNumberPagination)
 def all_tags(request):
-    return Tag.objects.all().order_by("name")
+    return tags.all()
 
 @router.get("/tags/{tag_id}", response={200: TagSchema, 404: ErrorOut})
+@cached_response
 def tag_by_id(request, tag_id: int):
     try:
-        tag = Tag.objects.get(id=tag_id)
+        tag = tags.get(id=tag_id)
         return tag
     except Tag.DoesNotExist:
         return 404, {"message": "Tag not found"}
 
 @router.get("/platforms", response=list[PlatformSchema])
+@cached_response
 @paginate(PageNumberPagination)
 def all_platforms(request): 
-    return Platform.objects.all()
+    return platforms.all()
 
 @router.get("/platforms/{platform_id}", response={200: PlatformSchema, 404: ErrorOut})
+@cached_response
 def platform_by_id(request, platform_id: int):
     try:
-        platform = Platform.objects.get(id=platform_id)
+        platform = platforms.get(id=platform_id)
         return platform
     except Platform.DoesNotExist:
         return 404, {"message": "Platform not found"}
 
 @router.get("/companies", response=list[CompanySchema])
+@cached_response
 @paginate(PageNumberPagination)
 def all_companies(request):
-    return Company.objects.all()
+    return companies.all()
 
 @router.get("/companies/{company_id}", response={200: CompanySchema, 404: ErrorOut})
+@cached_response
 def company_by_id(request, company_id: int):
     try:
-        company = Company.objects.get(id=company_id)
+        company = companies.get(id=company_id)
         return company
     except Company.DoesNotExist:
         return 404, {"message": "Company not found"}
\ No newline at end of file
@@ -0,0 +1,78 @@
+import hashlib
+from functools import wraps
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from ninja.decorators import decorate_view
+from .models import CatalogVersion
+from . import settings
+
+
+# Catalog response cache
+# Rendered responses of the games router are cached by path, normalized query
+# parameters and catalog version, so a version bump from populate invalidates them
+# all. Responses carry an ETag and Last-Modified and revalidations answer with 304.
+# Hits are served from inside the view so authentication still runs first.
+
+
+def response_key(request, version):
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values if value != "")
+    raw = f"{version}|{request.path}|{params}"
+    return "games:response:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def etag_for(key):
+    return f'"{key.rsplit(":", 1)[1][:20]}"'
+
+
+def not_modified(request, etag, updated):
+    tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("If-None-Match", "").split(",") if tag.strip()]
+    if tags:
+        return etag in tags or "*" in tags
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(updated.timestamp()) <= since
+
+
+def add_headers(response, etag, updated):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(updated.timestamp())
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Store rendered 200 responses of views marked by cached_response
+def store_response(run):
+    @wraps(run)
+    def wrapper(request, **kwargs):
+        response = run(request, **kwargs)
+        entry = getattr(request, "catalog_cache", None)
+        if entry is None:
+            return response
+
+        key, etag, updated, hit = entry
+        if not hit and response.status_code == 200:
+            cache.set(key, (response.content, response["Content-Type"]), settings.RESPONSE_CACHE_TTL)
+        return add_headers(response, etag, updated) if response.status_code in (200, 304) else response
+    return wrapper
+
+
+# Serve a games view from the response cache, place it under the router decorator
+def cached_response(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        stamp = CatalogVersion.current()
+        key = response_key(request, stamp.version)
+        etag = etag_for(key)
+
+        if not_modified(request, etag, stamp.updated):
+            request.catalog_cache = (key, etag, stamp.updated, True)
+            return HttpResponseNotModified()
+
+        stored = cache.get(key)
+        request.catalog_cache = (key, etag, stamp.updated, stored is not None)
+        if stored is not None:
+            content, content_type = stored
+            return HttpResponse(content, content_type=content_type)
+        return view(request, *args, **kwargs)
+
+    return decorate_view(store_response)(wrapper)
@@ -0,0 +1,93 @@
+import json
+import base64
+import hashlib
+from django.core.cache import cache
+from django.db.models import F, Q, Exists, OuterRef
+from .models import Game, Tag, Company
+from . import settings
+
+
+# Cursor pagination
+# Listings are read in (popularity, id) or (name, id) order from just after the last
+# row of the previous page, so deep pages cost the same as the first and rows do not
+# shift between pages. Games without a popularity sort below every other game.
+
+# Listing orders and the types their cursor values may take
+ORDERS = {"popularity": (int, float), "name": str}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order, lth, value, game_id):
+    raw = json.dumps([order, lth, value, game_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, order, lth):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order, cursor_lth, value, game_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+    if cursor_order != order or cursor_lth != lth or not isinstance(game_id, int):
+        raise InvalidCursor("Cursor does not match the requested order.")
+    if value is not None and (isinstance(value, bool) or not isinstance(value, ORDERS[order])):
+        raise InvalidCursor("Invalid cursor.")
+    return value, game_id
+
+
+# Games with every requested term (match "all") or any of them, terms are slugs or names
+def filtered(tags=None, companies=None, match="any"):
+    query = Game.objects.all()
+    for model, through, field, terms in [(Tag, Game.tags.through, "tag", tags), (Company, Game.companies.through, "company", companies)]:
+        if not terms:
+            continue
+        terms = [term.strip() for term in terms.split(",") if term.strip()]
+        groups = [terms] if match != "all" else [[term] for term in terms]
+        for group in groups:
+            ids = model.objects.filter(Q(slug__in=group) | Q(name__in=group)).values("id")
+            query = query.filter(Exists(through.objects.filter(game=OuterRef("pk"), **{f"{field}__in": ids})))
+    return query
+
+
+# Rows after the cursor position in the listing order
+def after(query, order, lth, value, game_id):
+    if lth:
+        if value is None:
+            return query.filter(Q(**{f"{order}__isnull": True}, id__gt=game_id) | Q(**{f"{order}__isnull": False}))
+        return query.filter(Q(**{f"{order}__gt": value}) | Q(**{order: value}, id__gt=game_id))
+    if value is None:
+        return query.filter(**{f"{order}__isnull": True}, id__lt=game_id)
+    return query.filter(Q(**{f"{order}__lt": value}) | Q(**{order: value}, id__lt=game_id) | Q(**{f"{order}__isnull": True}))
+
+
+# Ids of one page of games and the cursor of the next page, None on the last page
+def cursor_page(order=None, lth=False, cursor=None, size=settings.CURSOR_PAGE_SIZE, tags=None, companies=None, match="any"):
+    order = order if order in ORDERS else "popularity"
+    query = filtered(tags, companies, match)
+    if cursor:
+        query = after(query, order, lth, *decode_cursor(cursor, order, lth))
+
+    if lth:
+        ordering = (F(order).asc(nulls_first=True), "id")
+    else:
+        ordering = (F(order).desc(nulls_last=True), "-id")
+    rows = list(query.order_by(*ordering).values_list("id", order)[:size + 1])
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        game_id, value = rows[-1]
+        next_cursor = encode_cursor(order, lth, value, game_id)
+    return [game_id for game_id, value in rows], next_cursor
+
+
+# Approximate number of games matching the filters, counted at most once per TTL
+def approximate_total(tags=None, companies=None, match="any"):
+    key = "games:total:" + hashlib.sha1(json.dumps([tags, companies, match]).encode()).hexdigest()
+    total = cache.get(key)
+    if total is None:
+        total = filtered(tags, companies, match).count()
+        cache.set(key, total, settings.CURSOR_TOTAL_TTL)
+    return total
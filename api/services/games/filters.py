@@ -0,0 +1,191 @@
+from array import array
+from django.db import transaction
+from django.db.models import BinaryField
+from django.db.models.functions import Length, Substr
+from .models import Game, Tag, Company, GameIndex
+from .reference import TABLES
+from . import settings
+
+
+# Catalog filtering
+# Tags and companies map to sorted arrays of game ids and the catalog orders to arrays
+# of every game id, so a filtered page is set operations over the arrays followed by
+# fetching just the games of the page. With "any" a game needs one of the requested
+# tags (or companies), with "all" it needs every one of them.
+
+ORDERS = {
+    "popularity": ("-popularity", "id"),
+    "name": ("name", "id"),
+}
+
+
+def pack(ids):
+    return array("I", ids).tobytes()
+
+def unpack(data):
+    ids = array("I")
+    ids.frombytes(bytes(data))
+    return ids
+
+
+RELATIONS = {
+    "tag": (Game.tags.through, "tag_id"),
+    "company": (Game.companies.through, "company_id"),
+}
+
+
+# Arrays of every tag or company, or of just the `keys` ones
+def relation_rows(kind, keys=None):
+    through, field = RELATIONS[kind]
+    query = through.objects.order_by(field, "game_id").values_list(field, "game_id")
+    if keys is not None:
+        query = query.filter(**{f"{field}__in": keys})
+
+    rows = []
+    current, ids = None, []
+    for key, game_id in query.iterator():
+        if key != current and ids:
+            rows.append(GameIndex(kind=kind, key=str(current), games=pack(ids)))
+            ids = []
+        current = key
+        ids.append(game_id)
+    if ids:
+        rows.append(GameIndex(kind=kind, key=str(current), games=pack(ids)))
+    return rows
+
+def order_rows():
+    return [GameIndex(kind="order", key=name, games=pack(Game.objects.order_by(*ordering).values_list("id", flat=True))) for name, ordering in ORDERS.items()]
+
+
+# Rebuild every array from the games and their relations, returns the number of arrays
+def rebuild_filter_index():
+    rows = relation_rows("tag") + relation_rows("company") + order_rows()
+    with transaction.atomic():
+        GameIndex.objects.all().delete()
+        GameIndex.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+# Single edits rebuild just the arrays they affect, while the index is built
+def index_built():
+    return GameIndex.objects.filter(kind="order").exists()
+
+def rebuild_orders():
+    if not index_built():
+        return
+    rows = order_rows()
+    with transaction.atomic():
+        GameIndex.objects.filter(kind="order").delete()
+        GameIndex.objects.bulk_create(rows)
+
+# Every edited game moves in the order arrays, so edits only mark them out of date and the
+# next listing rebuilds them once however many games were edited since
+def mark_orders():
+    GameIndex.objects.bulk_create([GameIndex(kind="dirty", key="order", games=b"")], ignore_conflicts=True)
+
+def refresh_orders():
+    if not GameIndex.objects.filter(kind="dirty", key="order").exists():
+        return
+    # Only the listing that clears the mark rebuilds, edits after it mark the arrays again
+    with transaction.atomic():
+        if GameIndex.objects.filter(kind="dirty", key="order").delete()[0]:
+            rebuild_orders()
+
+def rebuild_keys(kind, keys):
+    keys = list(keys or [])
+    if not keys or not index_built():
+        return
+    rows = relation_rows(kind, keys)
+    with transaction.atomic():
+        GameIndex.objects.filter(kind=kind, key__in=[str(key) for key in keys]).delete()
+        GameIndex.objects.bulk_create(rows)
+
+
+# Game ids matching comma separated slugs or names of a tag or company model, None when not filtered
+def matching(model, kind, terms, match):
+    terms = [term.strip() for term in terms.split(",") if term.strip()]
+    if not terms:
+        return None
+
+    keys = {term: {str(row.id) for row in TABLES[model].find(term, ["slug", "name"])} for term in terms}
+
+    arrays = {row.key: row.games for row in GameIndex.objects.filter(kind=kind, key__in=set().union(*keys.values()))}
+    per_term = []
+    for term_keys in keys.values():
+        ids = set()
+        for key in term_keys:
+            ids.update(unpack(arrays.get(key, b"")))
+        per_term.append(ids)
+
+    if match == "all":
+        return set.intersection(*per_term)
+    return set().union(*per_term)
+
+
+# Ordered ids of the games matching the filters. `ranked` search results keep their
+# order, `matched` is an id subquery of search results listed in the requested order.
+# Filters are narrowed down to a set of game ids first. Unfiltered listings read only the
+# slice of the order array a page needs, small filtered sets are ordered by the database
+# and larger ones stream the order array by slices. None when the index has not been built
+def catalog_ids(ranked=None, order=None, lth=False, tags=None, companies=None, match="any", matched=None):
+    refresh_orders()
+    key = order if order in ORDERS else "popularity"
+    # Arrays run from most popular and from A, listings default to high to low
+    reverse = lth == (key == "popularity")
+
+    row = GameIndex.objects.filter(kind="order", key=key)
+    size = row.annotate(size=Length("games")).values_list("size", flat=True).first()
+    if size is None:
+        return None
+    ids = OrderIds(row, size // 4, reverse)
+
+    wanted = None
+    if matched is not None:
+        wanted = set(Game.objects.filter(id__in=matched).values_list("id", flat=True))
+    for model, kind, terms in [(Tag, "tag", tags), (Company, "company", companies)]:
+        if terms:
+            found = matching(model, kind, terms, match)
+            if found is not None:
+                wanted = found if wanted is None else wanted & found
+
+    if ranked is not None:
+        return [game_id for game_id in ranked if wanted is None or game_id in wanted]
+    if wanted is None:
+        return ids
+
+    if len(wanted) <= settings.FILTER_SORT_MAX:
+        query = Game.objects.filter(id__in=wanted).order_by(*ORDERS[key])
+        return list((query.reverse() if reverse else query).values_list("id", flat=True))
+
+    chunk = settings.FILTER_STREAM_CHUNK
+    return [game_id for start in range(0, len(ids), chunk) for game_id in ids[start:start + chunk] if game_id in wanted]
+
+
+# Ids of an order array, slices read and unpack only their part of it
+class OrderIds:
+    def __init__(self, row, size, reverse):
+        self.row = row
+        self.size = size
+        self.reverse = reverse
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start, stop, step = index.indices(self.size)
+        if stop <= start:
+            return []
+        if self.reverse:
+            start, stop = self.size - stop, self.size - start
+        part = self.row.annotate(part=Substr("games", start * 4 + 1, (stop - start) * 4, output_field=BinaryField())).values_list("part", flat=True).first()
+        ids = list(unpack(part or b""))
+        return ids[::-1] if self.reverse else ids
+
+
+# Ordered game ids of a listing, pages project just the games of their slice
+class GameList:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
@@ -3,15 +3,77 @@ import csv
 import requests
 from django.core.management.base import BaseCommand
 from ...models import *
-from django.db import transaction
-from collections import defaultdict
-import pandas as pd
+from ...search import rebuild_index
+from ...filters import rebuild_filter_index
+from ... import settings
+
+
+# Rows of a csv file, read one at a time
+def read_rows(file_path):
+    with open(file_path, newline='', encoding='utf-8') as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
+# Integer id of a csv id column, None when it is empty
+def id_of(value):
+    return int(value) if value and value.isdigit() else None
+
+
+# Compact set of game ids, one bit per id
+class IdSet:
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, game_id):
+        index = game_id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index - len(self.bits) + 1))
+        self.bits[index] |= 1 << (game_id & 7)
+
+    def __contains__(self, game_id):
+        if game_id is None:
+            return False
+        index = game_id >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (game_id & 7)))
+
+
+# Buffers rows of a model and writes them with bulk_create every `batch_size` rows,
+# the writer of the rows they reference is flushed first. `on_write` gets each batch
+# once it is written, a failed write is not retried and stops the command
+class BatchWriter:
+    def __init__(self, model, batch_size, ignore_conflicts=False, after=None, on_write=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts
+        self.after = after
+        self.on_write = on_write
+        self.pending = []
+        self.written = 0
+
+    def add(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.after is not None:
+            self.after.flush()
+        if self.pending:
+            rows, self.pending = self.pending, []
+            self.model.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=self.ignore_conflicts)
+            self.written += len(rows)
+            if self.on_write is not None:
+                self.on_write(rows)
 
 
 class Command(BaseCommand):
     help = 'Initial population of the database'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.POPULATE_BATCH_SIZE, help='Rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
 
         # Environment credentials
         CLIENT_ID = 'zpf3m1fonhiuqtlwge5ud3b50yg19a'
@@ -133,34 +195,18 @@ class Command(BaseCommand):
 
 
         # Processing
+        # Every csv is streamed and written in batches of `batch_size`. Games are joined
+        # against lookups holding only the games on a supported platform, duplicate
+        # relations and platform profiles are dropped by their unique constraints
 
         # Companies
-        file_path = file_paths['involved_companies']
-        df = pd.read_csv(file_paths['involved_companies'])
-        df = df.drop_duplicates(subset=['game', 'company'])
-        df.to_csv(file_path, index=False)
-        assert not df.duplicated(subset=['game', 'company']).any(), "Duplicates still exist in the CSV!"
-
-
         self.stdout.write(self.style.HTTP_INFO('Processing company data'))
-        self.stdout.write('- Creating company objects')
-        companies = []
-        with open(file_paths['companies'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                companies.append(
-                    Company(id=row["id"], name=row["name"])
-                )
-        # Map for retrieving companies for games - retrieve by fetching company map with game id
-        self.stdout.write('- Creating involved company map')
-        company_map = defaultdict(list)
-        with open(file_paths['involved_companies'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                company_map[row['game']].append(row['company'])
-        self.stdout.write('- Appending')     
-        Company.objects.bulk_create(companies)
-        self.stdout.write(self.style.SUCCESS('Appended '))
+        self.stdout.write('- Appending company objects')
+        companies = BatchWriter(Company, batch_size)
+        for row in read_rows(file_paths['companies']):
+            companies.add(Company(id=row["id"], name=row["name"]))
+        companies.flush()
+        self.stdout.write(self.style.SUCCESS(f'Appended {companies.written}'))
 
 
 
@@ -168,181 +214,136 @@ class Command(BaseCommand):
         # genres.csv & themes.csv 
         self.stdout.write(self.style.HTTP_INFO('Processing tag data'))
         self.stdout.write('- Genres data')
-        tags = []
-        genre_map = defaultdict(list)
-        theme_map = defaultdict(list)
-        with open(file_paths['genres'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                tag = Tag(name=row['name'])
-                genre_map[row['id']].append(tag)
-                tags.append(tag)
+        genre_map = {row['id']: Tag(name=row['name']) for row in read_rows(file_paths['genres'])}
         self.stdout.write('- Themes data')
-        with open(file_paths['themes'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                tag = Tag(name=row['name'])
-                theme_map[row['id']].append(tag)
-                tags.append(tag)
+        theme_map = {row['id']: Tag(name=row['name']) for row in read_rows(file_paths['themes'])}
         self.stdout.write('- Appending')
-        Tag.objects.bulk_create(tags)
+        Tag.objects.bulk_create([*genre_map.values(), *theme_map.values()], batch_size=batch_size)
         self.stdout.write(self.style.SUCCESS('Appended '))
 
-        
-        # Misc data 
+
+        # Platform data
+        # Games with a profile on a supported platform, only these are looked up below
         self.stdout.write(self.style.HTTP_INFO('Processing miscallaneous game data'))
+        self.stdout.write('- Platforms data')
+        supported_games = IdSet()
+        for row in read_rows(file_paths['external_games']):
+            game_id = id_of(row['game'])
+            if game_id is not None and platform_enums.get(row['category']) in supported_platforms:
+                supported_games.add(game_id)
+
         self.stdout.write('- Popularity data')
         popularity = {}
-        with open(file_paths['popularity_primitives'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                game_id = row['game_id']
-                value = float(row['value'])
-                popularity[game_id] = round(popularity.get(game_id, 0) + value, 6)  
-  
-                
+        for row in read_rows(file_paths['popularity_primitives']):
+            game_id = id_of(row['game_id'])
+            if game_id in supported_games:
+                popularity[game_id] = round(popularity.get(game_id, 0) + float(row['value']), 6)
+
         self.stdout.write('- Alias data')
         aliases = {}
-        with open(file_paths['aliases'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                aliases.setdefault(row['game'], []).append(row['name'])
+        for row in read_rows(file_paths['aliases']):
+            game_id = id_of(row['game'])
+            if game_id in supported_games:
+                aliases.setdefault(game_id, []).append(row['name'])
+
+        # Covers are kept as image ids and expanded to urls as games are written
         self.stdout.write('- Cover data')
         covers = {}
-        with open(file_paths['covers'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                covers[row['game']] = f"https://images.igdb.com/igdb/image/upload/t_cover_big/{row['image_id']}.webp"
+        for row in read_rows(file_paths['covers']):
+            game_id = id_of(row['game'])
+            if game_id in supported_games:
+                covers[game_id] = row['image_id']
+
 
-        # Platform data 
-        self.stdout.write('- Platforms data')
-        platforms_map = defaultdict(list)
-        with open(file_paths['external_games'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                game_id = row['game']
-                if row['category'] in platform_enums:
-                    if platform_enums[row['category']]:
-                        platforms_map[game_id].append(platform_enums[row['category']])
-                    else:
-                        pass
-        
-        
 
         # Games
         self.stdout.write(self.style.HTTP_INFO('Processing game data'))
-        games = []
-        game_relations = {}
+        written_games = IdSet()
         total_games = 0
 
-        with open(file_paths['games'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                total_games += 1
-
-                if row['category'] not in valid_categories or row['status'] not in valid_statuses:
-                    invalid_games += 1
-                    continue
-
-                if not any(platform in supported_platforms for platform in platforms_map.get(row['id'], [])):
-                    unsupported_platform_games += 1
-                    continue
+        def games_written(rows):
+            for game in rows:
+                written_games.add(game.id)
+
+        games = BatchWriter(Game, batch_size, on_write=games_written)
+        game_tags = BatchWriter(Game.tags.through, batch_size, ignore_conflicts=True, after=games)
+
+        for row in read_rows(file_paths['games']):
+            total_games += 1
+
+            if row['category'] not in valid_categories or row['status'] not in valid_statuses:
+                invalid_games += 1
+                continue
+
+            game_id = id_of(row['id'])
+            if game_id not in supported_games:
+                unsupported_platform_games += 1
+                continue
+
+            # Only building the rows is guarded, write errors stop the command
+            try:
+                game = Game(
+                    id=game_id,
+                    name=row['name'],
+                    aliases=aliases.pop(game_id, []),
+                    description=row.get('summary', ''),
+                    cover=f"https://images.igdb.com/igdb/image/upload/t_cover_big/{covers.pop(game_id)}.webp" if game_id in covers else '',
+                    popularity=popularity.pop(game_id, 0),
+                )
+                tags = [genre_map[genre] for genre in row.get('genres', '').split(',') if genre in genre_map]
+                tags += [theme_map[theme] for theme in row.get('themes', '').split(',') if theme in theme_map]
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Error creating game instance for game ID {row['id']}: {e}"))
+                invalid_games += 1
+                continue
 
+            games.add(game)
+            for tag in tags:
+                game_tags.add(Game.tags.through(game_id=game_id, tag_id=tag.id))
 
-                try:
-                    game_data = {
-                        'id': row['id'],
-                        'name': row['name'],
-                        'aliases': aliases.get(row['id'], []),
-                        'description': row.get('summary', ''),
-                        'cover': covers.get(row['id'], ''),
-                        'popularity': popularity.get(row['id'], 0),
-                    }
-
-                    game_instance = Game(**game_data)
-                    games.append(game_instance)
-
-                    genres = []
-                    themes = []
-
-                    for genre in row.get('genres', '').split(','):
-                        genres.extend(tag.id for tag in genre_map.get(genre, []))
-
-                    for theme in row.get('themes', '').split(','):
-                        themes.extend(tag.id for tag in theme_map.get(theme, []))
-
-                    game_relations[row['id']] = {
-                        'companies': company_map.get(row['id'], []),
-                        'tags': genres + themes,
-                    }
-                    
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Error creating game instance for game ID {row['id']}: {e}"))
-                    invalid_games += 1
-
-        self.stdout.write('- Created')
-        self.stdout.write('- Appending')
-        Game.objects.bulk_create(games)
-        self.stdout.write(self.style.SUCCESS(f"Appended "))
+        game_tags.flush()
+        self.stdout.write(self.style.SUCCESS(f"Appended {games.written}"))
 
 
         self.stdout.write(self.style.HTTP_INFO(f"Processing relationships"))
 
         self.stdout.write("Game & Company relations")
-        valid_game_ids = set(Game.objects.all().values_list('id', flat=True))
-
-        with open(file_paths['involved_companies'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            game_company_relations = []
-            for row in reader:
-                if int(row['game']) in valid_game_ids:
-                    game_company_relations.append(
-                        Game.companies.through(game_id=row['game'], company_id=row['company'])
-                    )
-        self.stdout.write("- Created")
-        Game.companies.through.objects.bulk_create(game_company_relations, batch_size=1000)
+        game_companies = BatchWriter(Game.companies.through, batch_size, ignore_conflicts=True)
+        for row in read_rows(file_paths['involved_companies']):
+            if id_of(row['game']) in written_games:
+                game_companies.add(Game.companies.through(game_id=row['game'], company_id=row['company']))
+        game_companies.flush()
         self.stdout.write(self.style.SUCCESS(f"Appended "))
 
 
-
-        # Game-Tag Relationships
-        self.stdout.write("Game & Tag relations")
-        game_tag_relations = []
-        for game_id, game_data in game_relations.items():
-            for tag_id in game_data['tags']:
-                game_tag_relations.append(
-                    Game.tags.through(game_id=game_id, tag_id=tag_id)
+        self.stdout.write("Platform Profiles")
+        platform_profiles = BatchWriter(GameInstance, batch_size, ignore_conflicts=True)
+        for row in read_rows(file_paths['external_games']):
+            if id_of(row['game']) in written_games and row['category'] in platform_enums:
+                platform = platform_enums[row['category']]
+                platform_profiles.add(
+                    GameInstance(game_id=row['game'], platform=platform, uid=row['uid'], url=row['url'] if row['url'] else construct_url(platform, row['uid']))
                 )
-
-        self.stdout.write("- Created")
-        Game.tags.through.objects.bulk_create(game_tag_relations, batch_size=1000)
+        platform_profiles.flush()
         self.stdout.write(self.style.SUCCESS(f"Appended "))
 
 
-        file_path = file_paths['external_games']
-        df = pd.read_csv(file_paths['external_games'])
-        df = df.drop_duplicates(subset=['game', 'category'])
-        df.to_csv(file_path, index=False)
-        assert not df.duplicated(subset=['game', 'category']).any(), "Duplicates still exist in the CSV!"
 
-        self.stdout.write("Platform Profiles")
-        platform_profiles = []
-        with open(file_paths['external_games'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if int(row['game']) in valid_game_ids:
-                    if row['category'] in platform_enums:
-                        platform_profiles.append(
-                            GameInstance(game_id=row['game'], platform=platform_enums[row['category']], uid=row['uid'], url=row['url'] if row['url'] else construct_url(platform_enums[row['category']], row['uid']))
-                        )
-        self.stdout.write("- Created")
-        GameInstance.objects.bulk_create(platform_profiles, batch_size=1000)
-        self.stdout.write(self.style.SUCCESS(f"Appended "))
+        self.stdout.write("Search index")
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} games"))
+
+        self.stdout.write("Catalog index")
+        arrays = rebuild_filter_index()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {arrays} arrays"))
+
+        version = CatalogVersion.bump()
+        self.stdout.write(self.style.SUCCESS(f"Catalog version {version.version}"))
 
 
 
         self.stdout.write(self.style.SUCCESS(f"Completed population"))
         self.stdout.write(f"Processed games: {total_games}")
-        self.stdout.write(f"Added: {len(games)}")
+        self.stdout.write(f"Added: {games.written}")
         self.stdout.write(f"Invalid: {invalid_games}")
         self.stdout.write(f"Unsupported: {unsupported_platform_games}")
\ No newline at end of file
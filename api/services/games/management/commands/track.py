@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 import requests
 from services.games.models import Platform, GameInstance
 from services.users.models import Account, User
+from services.tracking.settings import STEAM_KEY
 
 
 class Command(BaseCommand):
@@ -10,7 +11,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
 
-        STEAM_KEY = "40414F4976621E15EBC72CD08991C04C"
         STEAM_BASE_URL = "https://api.steampowered.com/"
         STEAM_STATS_URL = "/ISteamUserStats/"
         mysteamid = "992698250"
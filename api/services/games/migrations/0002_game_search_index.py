@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# Full-text index over game names and aliases, SQLite only
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    from services.games.search import CREATE, INDEX_ROWS
+    schema_editor.execute(CREATE)
+    schema_editor.execute(INDEX_ROWS)
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    from services.games.search import TABLE
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_game_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=50)),
+                ('games', models.BinaryField()),
+            ],
+            options={
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
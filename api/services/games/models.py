@@ -75,3 +75,38 @@ class GameInstance(models.Model):
 
     def __str__(self):
         return self.game.name + " - " + self.platform.name
+
+
+# Inverted catalog index - sorted game id arrays for each tag and company, and the
+# game ids in each catalog order. Rebuilt by populate
+class GameIndex(models.Model):
+    kind = models.CharField(max_length=20)
+    key = models.CharField(max_length=50)
+    games = models.BinaryField()
+
+    class Meta:
+        unique_together = ["kind", "key"]
+
+    def __str__(self):
+        return f"{self.kind} {self.key} index"
+
+
+# Catalog version stamp, bumped whenever games are loaded or changed
+class CatalogVersion(models.Model):
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(id=1)[0]
+
+    @classmethod
+    def bump(cls):
+        stamp = cls.current()
+        stamp.version = models.F('version') + 1
+        stamp.save()
+        stamp.refresh_from_db()
+        return stamp
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
@@ -0,0 +1,94 @@
+import orjson
+from collections import defaultdict
+from typing import Optional
+from django.http import HttpResponse
+from ninja import Field, Schema
+from ninja.pagination import PageNumberPagination
+from .models import Game, GameInstance
+from .filters import GameList
+from . import settings
+
+
+# Projected catalog listings
+# List endpoints build games in the shape of GameSchema from value projections of
+# the games of a page and maps of their related rows, then render them straight to
+# JSON - no model instances, prefetch querysets or schema validation. Clients pick a
+# sparse fieldset with `fields`, id is always included and unknown names are ignored,
+# SparseGameSchema declares that shape.
+
+SCALARS = ["name", "description", "aliases", "popularity", "cover"]
+RELATED = ["companies", "tags", "game_instances"]
+FIELDS = ["id", *SCALARS, *RELATED]
+
+
+def parse_fields(fields):
+    if not fields:
+        return FIELDS
+    wanted = {field.strip() for field in fields.split(",")} | {"id"}
+    return [field for field in FIELDS if field in wanted]
+
+
+# {"id", "name"} items of a tag or company relation by game id
+def related_map(through, field, ids):
+    related = defaultdict(list)
+    rows = through.objects.filter(game_id__in=ids).order_by(f"{field}_id").values_list("game_id", f"{field}_id", f"{field}__name")
+    for game_id, related_id, name in rows:
+        related[game_id].append({"id": related_id, "name": name})
+    return related
+
+def instance_map(ids):
+    instances = defaultdict(list)
+    rows = GameInstance.objects.filter(game_id__in=ids).order_by("id").values_list("game_id", "id", "platform_id", "platform__name", "uid", "url")
+    for game_id, instance_id, platform_id, platform_name, uid, url in rows:
+        instances[game_id].append({"id": instance_id, "platform": {"id": platform_id, "name": platform_name}, "uid": uid, "url": url})
+    return instances
+
+
+# Games of ordered ids as GameSchema shaped dicts with just the requested fields
+def game_rows(ids, fields=FIELDS):
+    ids = list(ids)
+    if not ids:
+        return []
+
+    rows = {row["id"]: row for row in Game.objects.filter(id__in=ids).values("id", *[field for field in SCALARS if field in fields])}
+    related = {}
+    if "companies" in fields:
+        related["companies"] = related_map(Game.companies.through, "company", ids)
+    if "tags" in fields:
+        related["tags"] = related_map(Game.tags.through, "tag", ids)
+    if "game_instances" in fields:
+        related["game_instances"] = instance_map(ids)
+
+    games = []
+    for game_id in ids:
+        row = rows.get(game_id)
+        if row is None:
+            continue
+        for field, items in related.items():
+            row[field] = items.get(game_id, [])
+        games.append(row)
+    return games
+
+
+def render(data, status=200):
+    return HttpResponse(orjson.dumps(data), status=status, content_type="application/json; charset=utf-8")
+
+
+# Page number pagination rendering projected pages of game ids or game querysets.
+# Clients may ask for up to LISTING_MAX_PAGE_SIZE games a page with `page_size`.
+# Without an Output the response schema is the one the operation declares
+class ProjectedPagination(PageNumberPagination):
+    Output = None
+
+    class Input(Schema):
+        page: int = Field(1, ge=1)
+        page_size: Optional[int] = Field(None, ge=1)
+
+    def paginate_queryset(self, queryset, pagination, fields=None, **params):
+        size = min(pagination.page_size or self.page_size, settings.LISTING_MAX_PAGE_SIZE)
+        offset = (pagination.page - 1) * size
+        if isinstance(queryset, GameList):
+            ids = queryset.ids[offset:offset + size]
+        else:
+            ids = list(queryset[offset:offset + size].values_list("id", flat=True))
+        return render({"items": game_rows(ids, parse_fields(fields)), "count": self._items_count(queryset)})
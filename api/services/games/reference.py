@@ -0,0 +1,106 @@
+import time
+import threading
+from .models import Platform, Tag, Company, CatalogVersion
+from . import settings
+
+
+# Reference table cache
+# Platforms, tags and companies only change when populate loads the catalog, so each
+# process keeps them in memory with lookups by id, name and slug. The catalog version
+# is read at most every REFERENCE_VERSION_CHECK seconds, or straight after a bump in this
+# process, and the tables are reloaded on their next use once it has moved on. Cached rows are shared, callers must not change them.
+
+
+class ReferenceTable:
+    def __init__(self, model, keys, ordering=None):
+        self.model = model
+        self.keys = keys
+        self.ordering = ordering
+        self.rows = None
+        self.index = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        query = self.model.objects.all()
+        if self.ordering:
+            query = query.order_by(self.ordering)
+        rows = list(query)
+        index = {key: {} for key in self.keys}
+        for row in rows:
+            for key in self.keys:
+                index[key].setdefault(getattr(row, key), []).append(row)
+        self.index = index
+        self.rows = rows
+
+    def loaded(self):
+        check()
+        with self.lock:
+            if self.rows is None:
+                self.load()
+            return self.rows, self.index
+
+    def clear(self):
+        with self.lock:
+            self.rows = None
+            self.index = None
+
+    def all(self):
+        return self.loaded()[0]
+
+    # First row by a single key lookup, raising DoesNotExist like a manager
+    def get(self, **lookup):
+        (key, value), = lookup.items()
+        rows = self.loaded()[1][key].get(value)
+        if not rows:
+            raise self.model.DoesNotExist(f"{self.model.__name__} matching {lookup} does not exist.")
+        return rows[0]
+
+    # Rows with any of the keys equal to the value
+    def find(self, value, keys):
+        index = self.loaded()[1]
+        return [row for key in keys for row in index[key].get(value, [])]
+
+    # Rows by id for the ids that exist
+    def in_bulk(self, ids):
+        index = self.loaded()[1]["id"]
+        return {row_id: index[row_id][0] for row_id in ids if row_id in index}
+
+
+platforms = ReferenceTable(Platform, ["id", "name"])
+tags = ReferenceTable(Tag, ["id", "name", "slug"], ordering="name")
+companies = ReferenceTable(Company, ["id", "name", "slug"])
+
+TABLES = {Platform: platforms, Tag: tags, Company: companies}
+
+version = None
+checked = 0
+check_lock = threading.Lock()
+
+
+# Catalog version read at most every REFERENCE_VERSION_CHECK seconds, every table is
+# cleared once it has moved on. Other in-process caches of the catalog key on it too
+def catalog_version():
+    global version, checked
+    if time.monotonic() - checked < settings.REFERENCE_VERSION_CHECK:
+        return version
+
+    with check_lock:
+        current = CatalogVersion.current().version
+        checked = time.monotonic()
+        if current != version:
+            version = current
+            clear()
+        return version
+
+def check():
+    catalog_version()
+
+# Read the version again on next use, for bumps made by this process
+def expire():
+    global checked
+    checked = 0
+
+
+def clear():
+    for table in TABLES.values():
+        table.clear()
@@ -1,5 +1,6 @@
 from .models import Platform, Company, Tag
 from ninja import ModelSchema, Schema
+from typing import Optional
 
 # Tag Schema
 class TagSchema(ModelSchema):
@@ -39,4 +40,43 @@ class GameSchema(Schema):
     cover: str
     companies: list[CompanySchema] 
     tags: list[TagSchema] 
-    game_instances: list[GameInstanceSchema]  
+    game_instances: list[GameInstanceSchema]
+
+
+# Game of a projected listing, fields left out of a sparse `fields` selection are absent
+class SparseGameSchema(Schema):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    aliases: Optional[list[str]] = None
+    popularity: Optional[float] = None
+    cover: Optional[str] = None
+    companies: Optional[list[CompanySchema]] = None
+    tags: Optional[list[TagSchema]] = None
+    game_instances: Optional[list[GameInstanceSchema]] = None
+
+
+# Page of games, the shape of the projected listings
+class PagedGameSchema(Schema):
+    items: list[SparseGameSchema]
+    count: int
+
+
+# Games of a batch request in request order, ids not found are listed as missing
+class GameBatchSchema(Schema):
+    items: list[SparseGameSchema]
+    missing: list[int]
+
+
+# Typeahead suggestion - just enough of a game to render it in a search box
+class GameSuggestSchema(Schema):
+    id: int
+    name: str
+    cover: Optional[str] = None
+
+
+# Cursor page of games, next is None on the last page and total only when requested
+class GameCursorSchema(Schema):
+    items: list[SparseGameSchema]
+    next: Optional[str] = None
+    total: Optional[int] = None
@@ -0,0 +1,91 @@
+import re
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from . import settings
+
+
+# Game search index
+# Game names and aliases are kept in an SQLite FTS5 table keyed by game id. Searches
+# match every word of the query as a prefix and rank matches by bm25 relevance blended
+# with the log of the game's popularity. Other backends fall back to substring filters.
+
+TABLE = "games_search"
+
+CREATE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}
+    USING fts5(name, aliases, tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+"""
+
+# Rows of the index for games, aliases flattened from their JSON list
+INDEX_ROWS = f"""
+    INSERT INTO {TABLE} (rowid, name, aliases)
+    SELECT id, name, COALESCE((SELECT group_concat(value, ' ') FROM json_each(games_game.aliases)), '')
+    FROM games_game
+"""
+
+
+def available():
+    return connection.vendor == "sqlite"
+
+
+# FTS5 query matching every word of the text as a prefix
+def match_query(text):
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+
+# Ids of games matching the text, best first, None when the backend has no index
+def search(text, limit=settings.SEARCH_LIMIT):
+    if not available():
+        return None
+
+    match = match_query(text)
+    if not match:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT {TABLE}.rowid FROM {TABLE}
+            JOIN games_game ON games_game.id = {TABLE}.rowid
+            WHERE {TABLE} MATCH %s
+            ORDER BY bm25({TABLE}, %s, %s) - %s * LN(1 + MAX(COALESCE(games_game.popularity, 0), 0))
+            LIMIT %s
+            """,
+            [match, settings.SEARCH_NAME_WEIGHT, settings.SEARCH_ALIAS_WEIGHT, settings.SEARCH_POPULARITY_WEIGHT, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Every game matching the text as an id subquery, uncapped, for listings in another
+# order than relevance. None when the backend has no index
+def matching(text):
+    if not available():
+        return None
+
+    match = match_query(text)
+    if not match:
+        return []
+    return RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [match])
+
+
+# Rebuild the whole index from the games table, returns the number of games indexed
+def rebuild_index():
+    if not available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE)
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(INDEX_ROWS)
+        return cursor.rowcount
+
+
+# Re-index some games, dropping the ones that no longer exist
+def index_games(game_ids):
+    if not available() or not game_ids:
+        return
+    game_ids = [int(game_id) for game_id in game_ids]
+    placeholders = ", ".join(["%s"] * len(game_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", game_ids)
+        cursor.execute(f"{INDEX_ROWS} WHERE games_game.id IN ({placeholders})", game_ids)
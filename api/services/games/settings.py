@@ -0,0 +1,46 @@
+# Search options
+# Most matches a search returns, ranked by relevance blended with popularity
+SEARCH_LIMIT = 500
+# Weight of a game's name over its aliases when ranking matches
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_ALIAS_WEIGHT = 4.0
+# How far popularity lifts a match, applied to the log of the game's popularity
+SEARCH_POPULARITY_WEIGHT = 0.5
+
+# Page number listing options
+LISTING_PAGE_SIZE = 20
+LISTING_MAX_PAGE_SIZE = 100
+
+# Catalog filter options
+# Filtered listings of at most this many games are ordered by the database, larger ones
+# stream the order array
+FILTER_SORT_MAX = 500
+# Ids read per slice when streaming an order array
+FILTER_STREAM_CHUNK = 16384
+
+# Cursor pagination options
+CURSOR_PAGE_SIZE = 20
+CURSOR_MAX_PAGE_SIZE = 100
+# Seconds an approximate total of a cursor listing is reused for
+CURSOR_TOTAL_TTL = 300
+
+# Response cache options
+# Seconds a rendered catalog response is kept, responses of older catalog versions are never read
+RESPONSE_CACHE_TTL = 60 * 60
+
+# Typeahead options
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 25
+# Prefixes up to this many characters have their best games precomputed
+SUGGEST_PREFIX_DEPTH = 3
+
+# Batch options
+BATCH_MAX_IDS = 300
+
+# Reference table cache options
+# Seconds between catalog version reads of the in-process platform, tag and company tables
+REFERENCE_VERSION_CHECK = 5
+
+# Populate options
+# Rows buffered per model before they are written, bounding the memory populate uses
+POPULATE_BATCH_SIZE = 1000
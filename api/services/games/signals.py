@@ -0,0 +1,78 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Game, Platform, Tag, Company, CatalogVersion
+from .search import index_games
+from .filters import mark_orders, rebuild_keys
+from .reference import TABLES, expire
+
+
+# Keep the search index in step with games saved one at a time, bulk loads rebuild it
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def game_changed(sender, instance, **kwargs):
+    index_games([instance.id])
+
+
+# Games changed outside populate rebuild just the catalog index arrays they are in, the
+# order arrays on the next listing. Cached responses go with the version bump
+@receiver(post_save, sender=Game)
+def catalog_changed(sender, **kwargs):
+    mark_orders()
+    CatalogVersion.bump()
+
+# Relations of a deleted game go with it in a cascade that sends no m2m signals
+@receiver(pre_delete, sender=Game)
+def catalog_removing(sender, instance, **kwargs):
+    instance._index_keys = {
+        "tag": list(instance.tags.values_list('id', flat=True)),
+        "company": list(instance.companies.values_list('id', flat=True)),
+    }
+
+@receiver(post_delete, sender=Game)
+def catalog_removed(sender, instance, **kwargs):
+    mark_orders()
+    for kind, keys in instance.__dict__.pop('_index_keys', {}).items():
+        rebuild_keys(kind, keys)
+    CatalogVersion.bump()
+
+@receiver(m2m_changed, sender=Game.tags.through)
+@receiver(m2m_changed, sender=Game.companies.through)
+def catalog_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    kind = "tag" if sender is Game.tags.through else "company"
+    if reverse:
+        keys = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_keys = list(getattr(instance, "tags" if kind == "tag" else "companies").values_list('id', flat=True))
+        return
+    else:
+        keys = instance.__dict__.pop('_cleared_keys', []) if action == "post_clear" else pk_set
+
+    if action in ("post_add", "post_remove", "post_clear"):
+        rebuild_keys(kind, keys)
+        CatalogVersion.bump()
+
+
+# Reference rows changed outside populate are reloaded here straight away and by
+# other processes once they see the version bump
+@receiver(post_save, sender=Platform)
+@receiver(post_delete, sender=Platform)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def reference_changed(sender, instance, **kwargs):
+    TABLES[sender].clear()
+    CatalogVersion.bump()
+
+# Arrays of deleted tags and companies go with them
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Company)
+def reference_removed(sender, instance, **kwargs):
+    rebuild_keys("tag" if sender is Tag else "company", [instance.pk])
+
+
+# Version bumps of this process are seen by its caches straight away, other processes
+# see them on their next throttled version read
+@receiver(post_save, sender=CatalogVersion)
+def version_bumped(sender, **kwargs):
+    expire()
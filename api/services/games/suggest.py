@@ -0,0 +1,101 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from heapq import nsmallest
+from django.db.models import F
+from .models import Game
+from .reference import catalog_version
+from . import settings
+
+
+# Process-local typeahead index
+# Every game is ranked by popularity and indexed under its normalized name and aliases,
+# from each word on, so "wild hunt" finds "The Witcher 3: Wild Hunt". Short prefixes,
+# which match the most keys, have their best games precomputed. Longer prefixes bisect
+# a sorted key array and keep the best ranks of the range. The index is built on first
+# use and rebuilt once the catalog version moves on, which is read at most every
+# REFERENCE_VERSION_CHECK seconds rather than on every keystroke.
+
+
+# Lowercased words without diacritics or punctuation
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+# Keys of a name or alias, one from each of its words
+def name_keys(text):
+    words = normalize(text).split()
+    return {" ".join(words[start:]) for start in range(len(words))}
+
+
+class SuggestIndex:
+    def __init__(self, version, games):
+        self.version = version
+        self.games = []
+        self.keys = []
+        self.tops = {}
+
+        # Games arrive best first, so each top list fills in rank order
+        for rank, (game_id, name, cover, aliases) in enumerate(games):
+            self.games.append({"id": game_id, "name": name, "cover": cover})
+            keys = name_keys(name)
+            for alias in aliases or []:
+                keys |= name_keys(alias)
+            for key in keys:
+                self.keys.append((key, rank))
+                for length in range(1, min(len(key), settings.SUGGEST_PREFIX_DEPTH) + 1):
+                    top = self.tops.setdefault(key[:length], [])
+                    if len(top) < settings.SUGGEST_MAX_LIMIT and rank not in top:
+                        top.append(rank)
+        self.keys.sort()
+
+    def __len__(self):
+        return len(self.games)
+
+    def lookup(self, text, limit):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+
+        if len(prefix) <= settings.SUGGEST_PREFIX_DEPTH:
+            ranks = self.tops.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, (prefix,))
+            end = bisect_left(self.keys, (prefix + "\uffff",), start)
+            ranks = nsmallest(limit, {rank for key, rank in self.keys[start:end]})
+        return [self.games[rank] for rank in ranks]
+
+
+index = None
+lock = threading.Lock()
+
+
+def build(version):
+    games = (
+        Game.objects.order_by(F('popularity').desc(nulls_last=True), 'id')
+        .values_list('id', 'name', 'cover', 'aliases')
+        .iterator()
+    )
+    return SuggestIndex(version, games)
+
+
+# Index of the current catalog version, built on first use and after catalog changes
+def get():
+    global index
+    version = catalog_version()
+    if index is not None and index.version == version:
+        return index
+
+    # One request rebuilds, others wait for it rather than building their own
+    with lock:
+        if index is None or index.version != version:
+            index = build(version)
+        return index
+
+
+# Games whose name or an alias has a word starting with the text, most popular first
+def suggest(text, limit=settings.SUGGEST_LIMIT):
+    return get().lookup(text, min(max(limit, 1), settings.SUGGEST_MAX_LIMIT))
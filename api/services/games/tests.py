@@ -1,3 +1,415 @@
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
+from authentication.utility import generate_token
+from services.users.models import User
+from .models import Game, GameInstance, Tag, CatalogVersion
+from .management.commands.populate import BatchWriter, IdSet
+from .cursor import encode_cursor
+from .filters import rebuild_filter_index
+from . import filters, reference, search, settings, suggest
 
-# Create your tests here.
+
+class GamesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.token = generate_token(self.user, "access")
+
+    def game(self, game_id, name, **fields):
+        return Game.objects.create(id=game_id, name=name, **{"description": "", "aliases": [], "cover": "https://example.com/cover.png", **fields})
+
+    def get(self, path, **headers):
+        return self.client.get(f"/api/games{path}", HTTP_AUTHORIZATION=f"Bearer {self.token}", **headers)
+
+
+class CursorPaginationTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        # Few distinct values so most pages end inside a group of ties
+        for game_id in range(1, 41):
+            self.game(game_id, f"Game {game_id % 3}", popularity=None if game_id % 10 == 0 else float(game_id % 4))
+
+    def pages(self, size, **params):
+        ids = []
+        cursor = None
+        while True:
+            query = "&".join(f"{key}={value}" for key, value in {"size": size, "cursor": cursor, **params}.items() if value is not None)
+            response = self.get(f"/cursor?{query}")
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [game["id"] for game in data["items"]]
+            cursor = data["next"]
+            if cursor is None:
+                return ids
+
+    def test_pages_are_stable_under_ties(self):
+        by_popularity = sorted(Game.objects.all(), key=lambda game: (game.popularity is not None, game.popularity or 0, game.id), reverse=True)
+        by_name = sorted(Game.objects.all(), key=lambda game: (game.name, game.id))
+        for params, games in [
+            ({}, by_popularity),
+            ({"lth": "true"}, by_popularity[::-1]),
+            ({"order": "name", "lth": "true"}, by_name),
+            ({"order": "name"}, by_name[::-1]),
+        ]:
+            for size in (1, 7, 40):
+                self.assertEqual(self.pages(size, **params), [game.id for game in games], (params, size))
+
+    def test_rows_added_before_the_cursor_do_not_shift_pages(self):
+        first = self.get("/cursor?size=10").json()
+        self.game(100, "New", popularity=3.0)
+        second = self.get(f"/cursor?size=10&cursor={first['next']}").json()
+
+        seen = [game["id"] for game in first["items"] + second["items"]]
+        self.assertEqual(len(set(seen)), 20)
+        self.assertNotIn(100, seen)
+
+    def test_malformed_cursor(self):
+        for cursor in ["!!!", "bm90IGpzb24", encode_cursor("popularity", False, 1, 1)[:-2], "WzEsMl0"]:
+            response = self.get(f"/cursor?cursor={cursor}")
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn("message", response.json())
+
+    def test_tampered_cursor(self):
+        for cursor in [
+            encode_cursor("name", False, "Game 1", 5),
+            encode_cursor("popularity", True, 1.0, 5),
+            encode_cursor("popularity", False, 1.0, "5"),
+            encode_cursor("popularity", False, {"value": 1}, 5),
+            encode_cursor("popularity", False, "1", 5),
+        ]:
+            self.assertEqual(self.get(f"/cursor?cursor={cursor}").status_code, 400, cursor)
+        self.assertEqual(self.get(f"/cursor?order=name&cursor={encode_cursor('name', False, [1], 5)}").status_code, 400)
+
+
+class ResponseCacheTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game(1, "Game", popularity=1.0)
+
+    def test_conditional_get(self):
+        response = self.get("/1")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        for headers in [
+            {"HTTP_IF_NONE_MATCH": etag},
+            {"HTTP_IF_NONE_MATCH": f'"other", W/{etag}'},
+            {"HTTP_IF_MODIFIED_SINCE": response["Last-Modified"]},
+        ]:
+            revalidated = self.get("/1", **headers)
+            self.assertEqual(revalidated.status_code, 304, headers)
+            self.assertEqual(revalidated["ETag"], etag)
+            self.assertEqual(revalidated.content, b"")
+
+        self.assertEqual(self.get("/1", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_revalidation_still_authenticates(self):
+        etag = self.get("/1")["ETag"]
+        self.assertEqual(self.client.get("/api/games/1", HTTP_IF_NONE_MATCH=etag).status_code, 401)
+
+    def test_version_bump_changes_response(self):
+        response = self.get("/1")
+        self.assertEqual(response.json()["name"], "Game")
+
+        # Queryset updates skip the catalog signals, the cached response is served until a bump
+        Game.objects.filter(id=1).update(name="Renamed")
+        self.assertEqual(self.get("/1").json()["name"], "Game")
+        self.assertEqual(self.get("/1", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        CatalogVersion.bump()
+        changed = self.get("/1", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["name"], "Renamed")
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.get("/2").status_code, 404)
+        self.game(2, "Other", popularity=1.0)
+        self.assertEqual(self.get("/2").status_code, 200)
+
+
+class ListingTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        for game_id in range(1, 31):
+            self.game(game_id, f"Game {game_id}", popularity=float(game_id))
+
+    def test_page_size(self):
+        data = self.get("/?order=popularity&page=2&page_size=7").json()
+        self.assertEqual(data["count"], 30)
+        self.assertEqual([game["id"] for game in data["items"]], list(range(23, 16, -1)))
+
+        self.assertEqual(len(self.get("/").json()["items"]), 20)
+        self.assertEqual(len(self.get("/?page_size=1000").json()["items"]), 30)
+        self.assertEqual(self.get("/?page_size=0").status_code, 422)
+
+    def test_sparse_fields(self):
+        items = self.get("/?fields=name,unknown&page_size=2").json()["items"]
+        self.assertEqual(items, [{"id": 30, "name": "Game 30"}, {"id": 29, "name": "Game 29"}])
+
+        schema = self.client.get("/api/openapi.json").json()["components"]["schemas"]
+        self.assertEqual(schema["SparseGameSchema"]["required"], ["id"])
+
+
+class BatchTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        for game_id in range(1, 21):
+            self.game(game_id, f"Game {game_id}", popularity=float(game_id))
+
+    def test_games_in_request_order(self):
+        data = self.get("/batch?ids=3,999,1,3&fields=name").json()
+        self.assertEqual(data["items"], [{"id": 3, "name": "Game 3"}, {"id": 1, "name": "Game 1"}])
+        self.assertEqual(data["missing"], [999])
+
+    def test_invalid_ids(self):
+        for ids in ["1,a", ",".join(str(game_id) for game_id in range(settings.BATCH_MAX_IDS + 1))]:
+            response = self.get(f"/batch?ids={ids}")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("message", response.json())
+
+    def test_a_fixed_number_of_queries(self):
+        # The first request loads the reference tables
+        self.get("/batch?ids=1")
+        queries = []
+        for ids in ["1,2", ",".join(str(game_id) for game_id in range(1, 21))]:
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.get(f"/batch?ids={ids}").status_code, 200)
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+
+class CatalogIndexTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        for game_id in range(1, 11):
+            self.game(game_id, f"Game {game_id}", popularity=float(game_id))
+        rebuild_filter_index()
+
+    def listed(self, query=""):
+        return [game["id"] for game in self.get(f"/?page_size=100&fields=id{query}").json()["items"]]
+
+    def test_edits_rebuild_orders_once(self):
+        with mock.patch("services.games.filters.rebuild_orders", wraps=filters.rebuild_orders) as rebuild:
+            for game in Game.objects.filter(id__lte=5):
+                game.popularity += 100
+                game.save()
+            self.assertEqual(rebuild.call_count, 0)
+
+            self.assertEqual(self.listed(), [5, 4, 3, 2, 1, 10, 9, 8, 7, 6])
+            self.assertEqual(self.listed("&lth=true"), [6, 7, 8, 9, 10, 1, 2, 3, 4, 5])
+        self.assertEqual(rebuild.call_count, 1)
+
+    def test_deleted_games_leave_orders(self):
+        Game.objects.get(id=10).delete()
+        self.assertEqual(self.listed(), list(range(9, 0, -1)))
+
+    def test_filtered_listings_sorted_and_streamed(self):
+        tags = [Tag.objects.create(name=f"Tag {i}") for i in range(2)]
+        for game in Game.objects.all():
+            game.tags.add(*[tag for index, tag in enumerate(tags) if game.id % (index + 2) == 0])
+
+        for sort_max in (settings.FILTER_SORT_MAX, 0):
+            cache.clear()
+            with mock.patch.object(settings, "FILTER_SORT_MAX", sort_max), mock.patch.object(settings, "FILTER_STREAM_CHUNK", 3):
+                self.assertEqual(self.listed("&tags=tag-0,tag-1"), [10, 9, 8, 6, 4, 3, 2], sort_max)
+                self.assertEqual(self.listed("&tags=tag-0,tag-1&lth=true"), [2, 3, 4, 6, 8, 9, 10], sort_max)
+                self.assertEqual(self.listed("&tags=tag-0,tag-1&order=name&lth=true"), [10, 2, 3, 4, 6, 8, 9], sort_max)
+                self.assertEqual(self.listed("&tags=tag-0,tag-1&match=all"), [6], sort_max)
+                self.assertEqual(self.listed("&tags=unknown"), [], sort_max)
+
+
+class SearchTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game(1, "The Witcher 3: Wild Hunt", aliases=["Witcher III"], popularity=10.0)
+        self.game(2, "Witcher Adventure Game", popularity=1.0)
+        self.game(3, "Pokémon Red", popularity=50.0)
+        self.game(4, "Hunt: Showdown", popularity=30.0)
+        rebuild_filter_index()
+
+    def listed(self, query):
+        data = self.get(f"/?page_size=100&fields=id&{query}").json()
+        return data["count"], [game["id"] for game in data["items"]]
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(search.search("witcher"), [1, 2])
+        self.assertEqual(search.search("wild hu"), [1])
+        self.assertEqual(search.search("pokemon"), [3])
+        self.assertEqual(search.search("iii"), [1])
+        self.assertEqual(search.search("witcher", limit=1), [1])
+        self.assertEqual(search.search("!!"), [])
+
+    def test_relevance_and_ordered_listings(self):
+        self.assertEqual(self.listed("search=hunt"), (2, [4, 1]))
+        self.assertEqual(self.listed("search=hunt&order=name"), (2, [1, 4]))
+        self.assertEqual(self.listed("search=hunt&order=name&lth=true"), (2, [4, 1]))
+        self.assertEqual(self.listed("search=witcher&order=popularity&lth=true"), (2, [2, 1]))
+
+    def test_edits_are_reindexed(self):
+        game = Game.objects.get(id=2)
+        game.name = "Gwent"
+        game.save()
+        self.assertEqual(search.search("witcher"), [1])
+        self.assertEqual(search.search("gwent"), [2])
+
+        Game.objects.get(id=1).delete()
+        self.assertEqual(search.search("witcher"), [])
+
+
+class SuggestTest(GamesTestCase):
+    def setUp(self):
+        super().setUp()
+        suggest.index = None
+        reference.expire()
+        self.game(1, "The Witcher 3: Wild Hunt", aliases=["Witcher III"], popularity=10.0)
+        self.game(2, "Wildermyth", popularity=20.0)
+
+    def suggested(self, text):
+        return [game["id"] for game in suggest.suggest(text)]
+
+    def test_prefixes_of_names_and_aliases(self):
+        self.assertEqual(self.suggested("wild"), [2, 1])
+        self.assertEqual(self.suggested("wild hu"), [1])
+        self.assertEqual(self.suggested("witcher iii"), [1])
+        self.assertEqual(self.suggested("hunting"), [])
+
+    def test_keystrokes_do_not_read_the_version(self):
+        self.suggested("w")
+        with self.assertNumQueries(0):
+            for text in ["wit", "witc", "witch"]:
+                self.assertEqual(self.suggested(text), [1])
+
+    def test_catalog_bump_rebuilds_index(self):
+        self.assertEqual(self.suggested("wild"), [2, 1])
+        self.game(3, "Wild Arms", popularity=30.0)
+        self.assertEqual(self.suggested("wild"), [3, 2, 1])
+
+    # Bumps by another process are only seen once the version is read again
+    def test_other_process_bump_is_seen_after_the_check_interval(self):
+        self.assertEqual(self.suggested("renamed"), [])
+        Game.objects.filter(id=2).update(name="Renamed")
+        CatalogVersion.objects.update(version=F("version") + 1)
+        self.assertEqual(self.suggested("renamed"), [])
+
+        with mock.patch.object(settings, "REFERENCE_VERSION_CHECK", 0):
+            self.assertEqual(self.suggested("renamed"), [2])
+
+
+class ReferenceTableTest(TestCase):
+    def setUp(self):
+        reference.clear()
+        reference.expire()
+        self.tags = [Tag.objects.create(name=name) for name in ("Role Playing", "Action")]
+
+    def test_lookups_are_served_from_memory(self):
+        reference.tags.all()
+        with self.assertNumQueries(0):
+            self.assertEqual([tag.name for tag in reference.tags.all()], ["Action", "Role Playing"])
+            self.assertEqual(reference.tags.get(slug="role-playing"), self.tags[0])
+            self.assertEqual(reference.tags.find("Action", ["slug", "name"]), [self.tags[1]])
+            self.assertEqual(reference.tags.in_bulk([self.tags[1].id, 999]), {self.tags[1].id: self.tags[1]})
+            with self.assertRaises(Tag.DoesNotExist):
+                reference.tags.get(slug="unknown")
+
+    def test_changes_reload_tables(self):
+        reference.tags.all()
+        Tag.objects.create(name="Puzzle")
+        self.assertEqual(len(reference.tags.all()), 3)
+
+        # Rows written by another process are read once the version has moved on
+        Tag.objects.bulk_create([Tag(name="Strategy", slug="strategy")])
+        self.assertEqual(len(reference.tags.all()), 3)
+        CatalogVersion.objects.update(version=F("version") + 1)
+        with mock.patch.object(settings, "REFERENCE_VERSION_CHECK", 0):
+            self.assertEqual(len(reference.tags.all()), 4)
+
+
+class PopulateTest(TestCase):
+    CSV = {
+        "companies": "id,name\n1,Studio\n",
+        "genres": "id,name\n1,Role Playing\n",
+        "themes": "id,name\n1,Fantasy\n",
+        "external_games": "game,category,uid,url\n10,1,100,\n10,5,101,https://gog.com/ten\n11,1,110,\n12,5,120,\n",
+        "popularity_primitives": "game_id,value\n10,1.5\n10,2\n11,0.5\n12,9\n",
+        "aliases": "game,name\n10,Alias\n12,Other\n",
+        "covers": "game,image_id\n10,abc\n",
+        "screenshots": "id,game\n",
+        "involved_companies": "game,company\n10,1\n12,1\n",
+        "games": "id,name,category,status,summary,genres,themes\n10,Ten,0,0,Summary,1,1\n11,Eleven,0,0,,,\n12,Twelve,0,0,,,\n13,Thirteen,3,0,,,\n",
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        csv_dir = Path(directory.name) / "services/games/management/commands/csv"
+        csv_dir.mkdir(parents=True)
+        for name, content in self.CSV.items():
+            (csv_dir / f"{name}.csv").write_text(content)
+
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+
+    def populate(self, batch_size):
+        token = mock.Mock(**{"json.return_value": {"access_token": "token"}})
+        out = StringIO()
+        with mock.patch("requests.post", return_value=token), mock.patch("requests.get") as download:
+            call_command("populate", batch_size=batch_size, stdout=out)
+        download.assert_not_called()
+        return out.getvalue()
+
+    # Single row batches flush every writer after the games its rows reference
+    def test_streams_supported_games_in_batches(self):
+        out = self.populate(1)
+        self.assertIn("Added: 2", out)
+        self.assertIn("Invalid: 1", out)
+        self.assertIn("Unsupported: 1", out)
+
+        ten = Game.objects.get(id=10)
+        self.assertEqual((ten.name, ten.aliases, ten.popularity), ("Ten", ["Alias"], 3.5))
+        self.assertEqual(ten.cover, "https://images.igdb.com/igdb/image/upload/t_cover_big/abc.webp")
+        self.assertEqual(sorted(ten.tags.values_list("name", flat=True)), ["Fantasy", "Role Playing"])
+        self.assertEqual(list(ten.companies.values_list("name", flat=True)), ["Studio"])
+        self.assertEqual(sorted(ten.game_instances.values_list("uid", flat=True)), ["100", "101"])
+        self.assertEqual(list(Game.objects.order_by("id").values_list("id", flat=True)), [10, 11])
+        self.assertFalse(GameInstance.objects.filter(uid="120").exists())
+
+        self.assertEqual(search.search("ten"), [10])
+        self.assertTrue(filters.index_built())
+
+    # Rows are written every batch_size adds, relations only after the games they reference
+    def test_batch_writer(self):
+        written = []
+        games = BatchWriter(Game, 2, on_write=lambda rows: written.append([game.id for game in rows]))
+        relations = BatchWriter(Game.tags.through, 2, ignore_conflicts=True, after=games)
+        tag = Tag.objects.create(name="Action")
+
+        with CaptureQueriesContext(connection) as queries:
+            for game_id in range(1, 6):
+                games.add(Game(id=game_id, name=f"Game {game_id}"))
+            relations.add(Game.tags.through(game_id=5, tag_id=tag.id))
+            relations.add(Game.tags.through(game_id=5, tag_id=tag.id))
+            relations.flush()
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(written, [[1, 2], [3, 4], [5]])
+        self.assertEqual((games.written, relations.written), (5, 2))
+        self.assertEqual(Game.tags.through.objects.count(), 1)
+
+    def test_id_set(self):
+        ids = IdSet()
+        for game_id in (0, 7, 8, 1000):
+            ids.add(game_id)
+        self.assertEqual([game_id for game_id in range(1001) if game_id in ids], [0, 7, 8, 1000])
+        self.assertNotIn(None, ids)
+        self.assertNotIn(5000, ids)
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Stat, StatValue, Achievement, AchievementStatus
+from .models import Stat, StatValue, Achievement, AchievementStatus, InstanceSchema
 
 # Register your models here.
 admin.site.register(Stat)
 admin.site.register(StatValue)
 admin.site.register(Achievement)
 admin.site.register(AchievementStatus)
+admin.site.register(InstanceSchema)
@@ -1,18 +1,19 @@
 from ninja import Router
 from django.shortcuts import get_object_or_404
 from utils.schemas import ErrorOut
+from utils.batch import parse_ids
 from .schemas import (
     StatSchema, StatValueSchema, AchievementSchema, AchievementStatusSchema, 
-    FullAchievementSchema, FullStatSchema, CompletionSchema,
+    FullAchievementSchema, FullStatSchema, CompletionSchema, UserCompletionSchema, AchievementRaritySchema,
+    TrackingSummarySchema,
 )
-from django.db.models import Avg, Count
+from django.db.models import Count
 from services.games.models import GameInstance, Game
 from services.users.models import Account, User
-from .models import Stat, StatValue, Achievement, AchievementStatus, InstanceCompletion, GameCompletion
-from django.utils.timezone import now as tznow
-from .track import stats_schema, stat_values, achievements_schema, achievement_statuses
-from datetime import timedelta
-from django.db import transaction
+from .models import Stat, StatValue, Achievement, AchievementStatus, GameCompletion, InstanceCounter
+from .store import sync_schema
+from .refresh import serve_player_rows, serve_completion, serve_completions
+from . import settings
 
 router = Router()
 
@@ -24,17 +25,12 @@ router = Router()
 @router.get("/stats/{instance_id}", response={200: list[StatSchema], 404: ErrorOut})
 def stat_schema(request, instance_id: int):
     instance = get_object_or_404(GameInstance, id=instance_id)
+    sync_schema(instance)
+
     stats = Stat.objects.filter(instance=instance)
-    if stats.exists():
-        return stats
-    
-    stats_data = stats_schema(instance)
-    if not stats_data:
+    if not stats.exists():
         return 404, {"message": "No stats available."}
-    
-    to_add = [Stat(instance=instance, name=stat['name'], displayname=stat['displayname']) for stat in stats_data]
-    Stat.objects.bulk_create(to_add)
-    return Stat.objects.filter(instance=instance)
+    return stats
 
 
 # One stat
@@ -57,26 +53,11 @@ def all_stat_values(request, instance_id: int, user_id: int):
     if not stats.exists():
         return 404, {"message": "No stats available."}
     
-    statvs = StatValue.objects.filter(stat__in=stats, user=user)
-    
-    account = Account.objects.filter(user=user, platform=instance.platform).first()
+    account = Account.objects.filter(user=user, platform_id=instance.platform_id).first()
     if not account:
         return 400, {"message": "No linked account."}
     
-    stats_data = stat_values(instance, account)
-    
-    missing = [StatValue(user=user, stat=stat, refresh=tznow()) for stat in stats if stat.id not in statvs.values_list('stat_id', flat=True)]
-    StatValue.objects.bulk_create(missing)
-    statvs = list(statvs) + missing
-    
-    toupdate = []
-    for statv in statvs:
-        if statv.expired():
-            statv.refresh = tznow() + timedelta(minutes=30)
-            statv.value = stats_data.get(statv.stat.name)
-            toupdate.append(statv)
-    
-    StatValue.objects.bulk_update(toupdate, ['refresh', 'value'])
+    statvs, achvs = serve_player_rows(instance, user, account, settings.REFRESH_MODES["stats"])
     return statvs
 
 
@@ -99,17 +80,27 @@ def one_stat_value(request, stat_id: int, user_id: int):
 @router.get("/achievements/{instance_id}", response={200: list[AchievementSchema], 400: ErrorOut})
 def achievement_schema(request, instance_id: int):
     instance = get_object_or_404(GameInstance, id=instance_id)
+    sync_schema(instance)
+
     achievements = Achievement.objects.filter(instance=instance)
-    if achievements.exists():
-        return achievements
-    
-    achievements_data = achievements_schema(instance)
-    if not achievements_data:
+    if not achievements.exists():
         return 400, {"message": "No achievements available."}
-    
-    to_add = [Achievement(instance=instance, name=ach['name'], displayname=ach['displayname'], icon=ach['icon']) for ach in achievements_data]
-    Achievement.objects.bulk_create(to_add)
-    return Achievement.objects.filter(instance=instance)
+    return achievements
+
+
+# Unlock percentage of every achievement of an instance
+@router.get("/achievements/{instance_id}/rarity", response={200: list[AchievementRaritySchema], 404: ErrorOut})
+def achievement_rarity(request, instance_id: int):
+    instance = get_object_or_404(GameInstance, id=instance_id)
+
+    achievements = Achievement.objects.filter(instance=instance)
+    if not achievements.exists():
+        return 404, {"message": "No achievements available."}
+
+    counter = InstanceCounter.objects.filter(instance=instance).first() or InstanceCounter(instance=instance)
+    for achievement in achievements:
+        achievement.percentage = round(counter.rarity(achievement), 2)
+    return achievements
 
 
 # One achievement
@@ -132,26 +123,11 @@ def all_achievement_statuses(request, instance_id: int, user_id: int):
     if not achievements.exists():
         return 404, {"message": "No achievements available."}
     
-    achvs = AchievementStatus.objects.filter(achievement__in=achievements, user=user)
-    
-    account = Account.objects.filter(user=user, platform=instance.platform).first()
+    account = Account.objects.filter(user=user, platform_id=instance.platform_id).first()
     if not account:
         return 400, {"message": "No linked account."}
     
-    statuses = achievement_statuses(instance, account)
-    
-    missing = [AchievementStatus(user=user, achievement=ach, refresh=tznow()) for ach in achievements if ach.id not in achvs.values_list('achievement_id', flat=True)]
-    AchievementStatus.objects.bulk_create(missing)
-    achvs = list(achvs) + missing
-    
-    toupdate = []
-    for achv in achvs:
-        if achv.expired():
-            achv.refresh = tznow() + timedelta(minutes=30)
-            achv.status = statuses.get(achv.achievement.name, False)
-            toupdate.append(achv)
-    
-    AchievementStatus.objects.bulk_update(toupdate, ['refresh', 'status'])
+    statvs, achvs = serve_player_rows(instance, user, account, settings.REFRESH_MODES["achievements"])
     return achvs
 
 # One achievement status
@@ -172,39 +148,66 @@ def one_achievement_status(request, achievement_id: int, user_id: int):
 def get_global_completion(request, instance_id: int):
     instance = get_object_or_404(GameInstance, id=instance_id)
 
-    available_achievements = Achievement.objects.filter(instance=instance)
-    total_achievements = available_achievements.count()
-
+    total_achievements = Achievement.objects.filter(instance=instance).count()
     if total_achievements == 0:
         return {"instance": instance.id, "percentage": 0.0} 
 
-    total_achieved = AchievementStatus.objects.filter(
-        achievement__in=available_achievements, status=True
-    ).count()
-
-    instance_count = InstanceCompletion.objects.filter(instance=instance).count() or 1 
-    global_completion = (total_achieved / (total_achievements * instance_count)) * 100
+    counter = InstanceCounter.objects.filter(instance=instance).first()
+    if not counter:
+        return 200, {"percentage": 0.0}
 
-    return 200, {"percentage": round(global_completion, 2)}
+    return 200, {"percentage": round(counter.completion(total_achievements), 2)}
 
 # Get a users completion value
-@router.get("/completion/{instance_id}/user/{user_id}", response={200: CompletionSchema, 404: ErrorOut})
+@router.get("/completion/{instance_id}/user/{user_id}", response={200: UserCompletionSchema, 404: ErrorOut})
 def get_user_completion(request, instance_id: int, user_id: int):
     instance = get_object_or_404(GameInstance, id=instance_id)
     if user_id: 
         user = get_object_or_404(User, id=user_id)
     else:
         user = request.auth
-    completion = InstanceCompletion.objects.filter(instance=instance, user=user).first()
+    completion = serve_completion(instance, user, settings.REFRESH_MODES["completion"])
+    return 200, completion
 
-    if not completion or completion.expired():
-        if not completion:
-            completion = InstanceCompletion(instance=instance, user=user)
-            with transaction.atomic():
-                completion.save()
-        completion.update()
+# Completion and unlocked achievements of a user across instances in a fixed number of
+# queries, instances not found are listed as missing
+@router.get("/summary/user/{user_id}", response={200: TrackingSummarySchema, 400: ErrorOut, 404: ErrorOut})
+def user_summary(request, user_id: int, instances: str):
+    if user_id: 
+        user = get_object_or_404(User, id=user_id)
+    else:
+        user = request.auth
 
-    return 200, completion
+    try:
+        ids = parse_ids(instances, settings.SUMMARY_MAX_INSTANCES)
+    except ValueError as e:
+        return 400, {"message": str(e)}
+
+    found = GameInstance.objects.in_bulk(ids)
+    completions = serve_completions(list(found.values()), user, settings.REFRESH_MODES["completion"])
+    achievements = dict(
+        Achievement.objects.filter(instance__in=found).values('instance_id')
+        .annotate(total=Count('id')).order_by().values_list('instance_id', 'total')
+    )
+    unlocked = dict(
+        AchievementStatus.objects.filter(user=user, status=True, achievement__instance__in=found).values('achievement__instance_id')
+        .annotate(total=Count('id')).order_by().values_list('achievement__instance_id', 'total')
+    )
+
+    items = []
+    for instance_id in ids:
+        if instance_id not in found:
+            continue
+        completion = completions.get(instance_id)
+        items.append({
+            "instance": instance_id,
+            "achievements": achievements.get(instance_id, 0),
+            "unlocked": unlocked.get(instance_id, 0),
+            "percentage": completion.percentage if completion else None,
+            "refresh": completion.refresh if completion else None,
+            "stale": completion.expired() if completion else True,
+        })
+    return 200, {"items": items, "missing": [instance_id for instance_id in ids if instance_id not in found]}
 
 # Game completion average across instances
 @router.get("/completion/game/{game_id}", response={200: CompletionSchema, 404: ErrorOut})
@@ -212,13 +215,7 @@ def get_game_completion(request, game_id: int):
     game = get_object_or_404(Game, id=game_id)
 
     game_completion = GameCompletion.objects.filter(game=game).first()
-
-    if not game_completion or game_completion.expired():
-        if not game_completion:
-            game_completion = GameCompletion(game=game)
-            with transaction.atomic():
-                game_completion.save()
-
-        game_completion.update()
+    if not game_completion:
+        return 200, {"percentage": 0.0}
 
     return 200, game_completion
\ No newline at end of file
@@ -0,0 +1,183 @@
+from collections import defaultdict
+from . import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, Q, Min, FloatField
+from django.utils.timezone import now as tznow
+from .models import Stat, StatValue, Achievement, AchievementStatus, InstanceCounter
+from .track import player_snapshot
+from .signals import send_stat_values
+
+
+# Player snapshot ingestion
+# One upstream fetch per (instance, account) refreshes both the stat values and
+# the achievement statuses of a user, so loading the stats and achievements of an
+# instance back to back only reaches the platform once.
+
+# Count players new to instances, as (instance id, user id) pairs found without achievement statuses.
+# Each player's status for the first achievement of the instance is created on its own, so when two
+# first refreshes race only the one whose insert created it counts the player
+def record_players(pairs):
+    if not pairs:
+        return
+    firsts = dict(
+        Achievement.objects.filter(instance__in={instance_id for instance_id, user_id in pairs})
+        .values('instance_id').annotate(first=Min('id')).order_by().values_list('instance_id', 'first')
+    )
+    players = [
+        (instance_id, user_id) for instance_id, user_id in pairs
+        if instance_id in firsts and AchievementStatus.objects.get_or_create(user_id=user_id, achievement_id=firsts[instance_id])[1]
+    ]
+    InstanceCounter.record(players=players)
+
+
+# Rows of a model for a user over every item of an instance, missing rows inserted in one pass.
+# With `players` a user without rows yet is counted as a new player of the instance
+def reconcile(model, field, items, instance, user, players=False):
+    rows = model.objects.filter(**{f"{field}__instance": instance}, user=user).select_related(field)
+    existing = set(rows.values_list(f"{field}_id", flat=True))
+    missing = [model(user=user, refresh=tznow(), **{field: item}) for item in items if item.id not in existing]
+    if players and missing and not existing:
+        record_players([(instance.id, user.id)])
+    model.objects.bulk_create(missing, ignore_conflicts=True)
+    return list(rows)
+
+
+# Stat value & achievement status rows for a user, missing rows created
+def player_rows(instance, user):
+    statvs = reconcile(StatValue, 'stat', Stat.objects.filter(instance=instance), instance, user)
+    achvs = reconcile(AchievementStatus, 'achievement', Achievement.objects.filter(instance=instance), instance, user, players=True)
+    return statvs, achvs
+
+
+# Apply a snapshot to rows due before the cutoff, returns the rows that changed
+# and the ids of the achievement statuses it flipped
+def apply_snapshot(snapshot, statvs, achvs, cutoff):
+    refresh = tznow() + settings.REFRESH_INTERVAL
+    stats_data = snapshot.get('stats', {})
+    statuses = snapshot.get('achievements', {})
+
+    statvs_updated = []
+    for statv in statvs:
+        if statv.refresh < cutoff:
+            statv.refresh = refresh
+            statv.value = stats_data.get(statv.stat.name)
+            statvs_updated.append(statv)
+
+    achvs_updated = []
+    flipped = set()
+    for achv in achvs:
+        if achv.refresh < cutoff:
+            status = statuses.get(achv.achievement.name, False)
+            if status != achv.status:
+                flipped.add(achv.id)
+            achv.refresh = refresh
+            achv.status = status
+            achvs_updated.append(achv)
+
+    return statvs_updated, achvs_updated, flipped
+
+
+# Conditional writes
+# Rows are only written while still due before the cutoff, so when two refreshes race
+# over the same rows the first write wins and the other leaves them alone. Signals and
+# counters follow the rows that were written rather than the ones that were fetched.
+
+# Rows a conditional update wrote, read back by the refresh it set when it skipped some
+def written_rows(model, rows, refresh, count):
+    if count == len(rows):
+        return rows
+    ids = set(model.objects.filter(id__in=[row.id for row in rows], refresh=refresh).values_list('id', flat=True))
+    return [row for row in rows if row.id in ids]
+
+# Rows in batches of at most WRITE_BATCH_SIZE
+def batches(rows):
+    for start in range(0, len(rows), settings.WRITE_BATCH_SIZE):
+        yield rows[start:start + settings.WRITE_BATCH_SIZE]
+
+# Write the refresh and one field of rows with one update per batch, returns the rows written
+def write_due(model, rows, field, output_field, cutoff, refresh):
+    written = []
+    for batch in batches(rows):
+        values = Case(
+            *[When(id=row.id, then=Value(getattr(row, field))) for row in batch if getattr(row, field) is not None],
+            default=Value(None), output_field=output_field,
+        )
+        count = model.objects.filter(id__in=[row.id for row in batch], refresh__lt=cutoff).update(refresh=refresh, **{field: values})
+        written += written_rows(model, batch, refresh, count)
+    return written
+
+def write_stat_values(statvs, cutoff, refresh):
+    written = write_due(StatValue, statvs, 'value', FloatField(), cutoff, refresh)
+    send_stat_values(written)
+    return written
+
+# Flipped statuses are written with one update per batch guarded on their old status, so an unlock
+# seen by two refreshes is only counted by the one that wrote it. Unchanged statuses are written apart
+def write_statuses(achvs, flipped, cutoff, refresh):
+    flips = [achv for achv in achvs if achv.id in flipped]
+    unchanged = [achv for achv in achvs if achv.id not in flipped]
+
+    written = []
+    for batch in batches(flips):
+        count = AchievementStatus.objects.filter(
+            Q(id__in=[achv.id for achv in batch if achv.status], status=False) | Q(id__in=[achv.id for achv in batch if not achv.status], status=True),
+            refresh__lt=cutoff,
+        ).update(status=Case(When(status=True, then=Value(False)), default=Value(True)), refresh=refresh)
+        written += written_rows(AchievementStatus, batch, refresh, count)
+    InstanceCounter.record(flips=[(achv.achievement.instance_id, achv.achievement_id, achv.status) for achv in written])
+
+    for batch in batches(unchanged):
+        count = AchievementStatus.objects.filter(id__in=[achv.id for achv in batch], refresh__lt=cutoff).update(refresh=refresh)
+        written += written_rows(AchievementStatus, batch, refresh, count)
+    return written
+
+
+# Put off due rows whose snapshot could not be fetched, so they are fetched again after
+# FETCH_RETRY rather than on every request while they stay due
+def back_off(rows, cutoff):
+    retry = tznow() + settings.FETCH_RETRY
+    ids = defaultdict(list)
+    for row in rows:
+        ids[type(row)].append(row.id)
+    for model, model_ids in ids.items():
+        for batch in batches(model_ids):
+            model.objects.filter(id__in=batch, refresh__lt=cutoff).update(refresh=retry)
+
+
+# Write applied rows back, returns the stat values and achievement statuses written
+def write_snapshot(cutoff, statvs_updated, achvs_updated, flipped=()):
+    with transaction.atomic():
+        statvs_written = write_stat_values(statvs_updated, cutoff, statvs_updated[0].refresh) if statvs_updated else []
+        achvs_written = write_statuses(achvs_updated, flipped, cutoff, achvs_updated[0].refresh) if achvs_updated else []
+    return statvs_written, achvs_written
+
+
+# Rows with the ones a conditional write skipped read back, as another refresh wrote them
+# first and the applied values are not the stored ones
+def skipped_read_back(model, field, rows, updated, written):
+    written = {row.id for row in written}
+    skipped = [row.id for row in updated if row.id not in written]
+    if not skipped:
+        return rows
+    stored = model.objects.select_related(field).in_bulk(skipped)
+    return [stored.get(row.id, row) for row in rows]
+
+
+# Refresh all stat values and achievement statuses of a user for an instance
+def ingest_snapshot(instance, user, account):
+    statvs, achvs = player_rows(instance, user)
+
+    cutoff = tznow()
+    if not any(row.refresh < cutoff for row in statvs + achvs):
+        return statvs, achvs
+
+    snapshot = player_snapshot(instance, account)
+    if snapshot is None:
+        back_off([row for row in statvs + achvs if row.refresh < cutoff], cutoff)
+        return statvs, achvs
+
+    statvs_updated, achvs_updated, flipped = apply_snapshot(snapshot, statvs, achvs, cutoff)
+    statvs_written, achvs_written = write_snapshot(cutoff, statvs_updated, achvs_updated, flipped)
+    statvs = skipped_read_back(StatValue, 'stat', statvs, statvs_updated, statvs_written)
+    achvs = skipped_read_back(AchievementStatus, 'achievement', achvs, achvs_updated, achvs_written)
+    return statvs, achvs
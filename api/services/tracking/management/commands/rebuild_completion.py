@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from services.tracking.models import GameCompletion, InstanceCompletion
+
+
+class Command(BaseCommand):
+    help = 'Rebuild game completion rollups from instance completions'
+
+    def handle(self, *args, **kwargs):
+        rollups = InstanceCompletion.objects.values('instance__game').annotate(total=Sum('percentage'), count=Count('id')).order_by()
+
+        with transaction.atomic():
+            GameCompletion.objects.all().delete()
+            GameCompletion.objects.bulk_create(
+                (GameCompletion(game_id=row['instance__game'], total=row['total'] or 0, count=row['count'], percentage=(row['total'] or 0) / row['count']) for row in rollups.iterator()),
+                batch_size=1000,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {GameCompletion.objects.count()} game completions"))
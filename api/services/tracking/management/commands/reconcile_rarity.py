@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from services.tracking.models import Achievement, AchievementStatus, InstanceCounter
+
+
+class Command(BaseCommand):
+    help = 'Recount achievement unlocks and instance rarity counters from achievement statuses, required after deleting statuses or users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100, help='Instances recounted per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        instances = Achievement.objects.values_list('instance_id', flat=True).distinct().order_by('instance_id')
+
+        # Instances are recounted a chunk at a time so no transaction covers the whole table
+        chunk = []
+        recounted = 0
+        for instance_id in instances.iterator():
+            chunk.append(instance_id)
+            if len(chunk) == chunk_size:
+                recounted += self.recount(chunk)
+                chunk = []
+        if chunk:
+            recounted += self.recount(chunk)
+
+        InstanceCounter.objects.exclude(instance__in=Achievement.objects.values('instance_id')).delete()
+        self.stdout.write(self.style.SUCCESS(f"Recounted {recounted} achievements"))
+
+    # Recount the achievements and counters of a chunk of instances
+    def recount(self, instance_ids):
+        with transaction.atomic():
+            achievements = list(
+                Achievement.objects.filter(instance__in=instance_ids)
+                .annotate(counted=Count('achievementstatus', filter=Q(achievementstatus__status=True)))
+            )
+            for achievement in achievements:
+                achievement.unlocks = achievement.counted
+            Achievement.objects.bulk_update(achievements, ['unlocks'], batch_size=1000)
+
+            players = dict(
+                AchievementStatus.objects.filter(achievement__instance__in=instance_ids)
+                .values('achievement__instance_id').annotate(players=Count('user_id', distinct=True))
+                .order_by().values_list('achievement__instance_id', 'players')
+            )
+            unlocks = {}
+            for achievement in achievements:
+                unlocks[achievement.instance_id] = unlocks.get(achievement.instance_id, 0) + achievement.unlocks
+
+            InstanceCounter.objects.filter(instance__in=instance_ids).delete()
+            InstanceCounter.objects.bulk_create(
+                InstanceCounter(instance_id=instance_id, players=players.get(instance_id, 0), unlocks=unlocks.get(instance_id, 0))
+                for instance_id in instance_ids
+            )
+
+        return len(achievements)
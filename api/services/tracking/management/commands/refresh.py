@@ -0,0 +1,188 @@
+import time
+import heapq
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q, Exists, OuterRef
+from django.utils.timezone import now as tznow
+from services.tracking import settings
+from services.tracking.models import StatValue, AchievementStatus, InstanceCompletion
+from services.boards.models import StatBoardPlayer, AchievementBoardPlayer, CompletionBoardPlayer
+from services.boards.refresh import refresh_rows
+
+# Tracking tables with the lookup from a row to its instance, what to select with it,
+# the item field of a row and the board players and board relation tracking that item
+SOURCES = [
+    (StatValue, 'stat__instance_id', 'stat__instance', 'stat', StatBoardPlayer, 'stats'),
+    (AchievementStatus, 'achievement__instance_id', 'achievement__instance', 'achievement', AchievementBoardPlayer, 'achievements'),
+    (InstanceCompletion, 'instance_id', 'instance', 'instance', CompletionBoardPlayer, 'instances'),
+]
+
+# Seconds between due row and lag reports
+REPORT_INTERVAL = 300
+
+
+# Upstream call budget, refilled continuously at `per_minute` calls a minute
+class Budget:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, calls):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= calls
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+
+# Rows refreshed first - those of recently seen users and those a board tracks for
+# one of its players, on the platform the player joined it on
+def priority_scope(related, field, players, items):
+    on_board = players.objects.filter(
+        user=OuterRef('user_id'),
+        platform=OuterRef(f'{related}__platform_id'),
+        **{f'board__{items}': OuterRef(f'{field}_id')},
+    )
+    return Q(user__last_seen__gte=tznow() - settings.SCHEDULER_SEEN_WINDOW) | Q(Exists(on_board))
+
+
+# Due (user, instance) pairs by (priority, refresh), kept between batches. Every priority
+# and table is read in (refresh, id) order from where its last read stopped, so a refill
+# only reads rows that came due since. Once a refill reads nothing the positions start
+# over, picking up rows whose refresh was moved back.
+class Queue:
+    def __init__(self, read_size):
+        self.read_size = read_size
+        self.heap = []
+        self.queued = {}
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.queued)
+
+    def refill(self):
+        now = tznow()
+        read = 0
+        for model, instance_field, related, field, players, items in SOURCES:
+            for priority, scope in enumerate([priority_scope(related, field, players, items), Q()]):
+                rows = model.objects.filter(scope, refresh__lt=now)
+                position = self.positions.get((model, priority))
+                if position is not None:
+                    rows = rows.filter(Q(refresh__gt=position[0]) | Q(refresh=position[0], id__gt=position[1]))
+
+                for row_id, user_id, instance_id, refresh in rows.order_by('refresh', 'id').values_list('id', 'user_id', instance_field, 'refresh')[:self.read_size]:
+                    read += 1
+                    self.positions[(model, priority)] = (refresh, row_id)
+                    self.push((priority, refresh), (user_id, instance_id))
+
+        if not read:
+            self.positions.clear()
+        return read
+
+    # Queue a pair, or move it ahead when it turns up with a better rank
+    def push(self, rank, key):
+        if key in self.queued and self.queued[key] <= rank:
+            return
+        self.queued[key] = rank
+        heapq.heappush(self.heap, (*rank, *key))
+
+    def pop(self, size):
+        batch = set()
+        while self.heap and len(batch) < size:
+            priority, refresh, *key = heapq.heappop(self.heap)
+            key = tuple(key)
+            # Entries a better rank of the same pair replaced are skipped
+            if self.queued.get(key) == (priority, refresh):
+                del self.queued[key]
+                batch.add(key)
+        return batch
+
+
+class Command(BaseCommand):
+    help = 'Continuously refresh due stat values, achievement statuses and completions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=settings.SCHEDULER_BUDGET, help='Upstream calls per minute')
+        parser.add_argument('--batch-size', type=int, default=settings.SCHEDULER_BATCH_SIZE, help='(user, instance) pairs refreshed per batch')
+        parser.add_argument('--once', action='store_true', help='Refresh a single batch and exit')
+        parser.add_argument('--status', action='store_true', help='Report due rows and lag and exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.report()
+            return
+
+        batch_size = options['batch_size']
+        budget = Budget(options['budget'], burst=batch_size)
+        queue = Queue(read_size=batch_size * 10)
+        reported = time.monotonic()
+
+        while True:
+            close_old_connections()
+
+            if len(queue) < batch_size:
+                queue.refill()
+            batch = queue.pop(batch_size)
+
+            if batch:
+                budget.take(len(batch))
+                calls = self.refresh(batch)
+                self.stdout.write(f"Refreshed {len(batch)} pairs with {calls} upstream calls")
+
+            if options['once']:
+                self.report(queue)
+                return
+
+            if time.monotonic() - reported > REPORT_INTERVAL:
+                self.report(queue)
+                reported = time.monotonic()
+
+            if not batch:
+                time.sleep(settings.SCHEDULER_IDLE)
+
+    # Refresh every due row of the given (user, instance) pairs, returns the number of upstream calls
+    def refresh(self, pairs):
+        now = tznow()
+        users = {user_id for user_id, instance_id in pairs}
+        instances = {instance_id for user_id, instance_id in pairs}
+
+        rows = {}
+        for model, instance_field, related, field, players, items in SOURCES:
+            due = model.objects.filter(user__in=users, **{f"{instance_field}__in": instances}, refresh__lt=now).select_related(related)
+            rows[model] = [row for row in due if (row.user_id, self.instance_of(row).id) in pairs]
+
+        calls = refresh_rows(statvs=rows[StatValue], achvs=rows[AchievementStatus], completions=rows[InstanceCompletion])
+
+        # Rows without a linked account or a successful fetch are retried later rather than blocking the queue
+        for model, model_rows in rows.items():
+            failed = [row.id for row in model_rows if row.refresh < now]
+            model.objects.filter(id__in=failed).update(refresh=now + settings.SCHEDULER_RETRY)
+
+        return calls
+
+    def instance_of(self, row):
+        if isinstance(row, StatValue):
+            return row.stat.instance
+        if isinstance(row, AchievementStatus):
+            return row.achievement.instance
+        return row.instance
+
+    # Due rows of every table and the age of the oldest, read from the refresh indexes
+    # rather than by counting distinct pairs
+    def report(self, queue=None):
+        now = tznow()
+        due = []
+        oldest = []
+        for model, *lookups in SOURCES:
+            rows = model.objects.filter(refresh__lt=now)
+            due.append(f"{model.__name__} {rows.count()}")
+            refresh = rows.order_by('refresh').values_list('refresh', flat=True).first()
+            if refresh is not None:
+                oldest.append(refresh)
+        lag = (now - min(oldest)).total_seconds() if oldest else 0
+
+        queued = f" - queued pairs: {len(queue)}" if queue is not None else ""
+        self.stdout.write(f"Due rows: {', '.join(due)}{queued} - lag: {lag:.0f}s")
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0012_gamecompletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstanceSchema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('synced', models.DateTimeField(default=django.utils.timezone.now)),
+                ('refresh', models.DateTimeField(default=django.utils.timezone.now)),
+                ('instance', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='schema', to='games.gameinstance')),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Removes duplicate tracking rows ahead of the unique constraints added in 0015.
+# Rows are scanned in windows of user ids and each window is deleted in its own
+# short transaction, so large tables are never locked for the whole migration.
+
+from django.db import migrations, transaction
+
+USERS_PER_WINDOW = 500
+DELETE_BATCH_SIZE = 500
+
+
+def dedup(model, key):
+    user_ids = model.objects.order_by('user_id').values_list('user_id', flat=True)
+    low, high = user_ids.first(), user_ids.last()
+    if low is None:
+        return
+
+    for start in range(low, high + 1, USERS_PER_WINDOW):
+        rows = model.objects.filter(user_id__gte=start, user_id__lt=start + USERS_PER_WINDOW)
+
+        # Keep the newest row of every (user, key) group
+        seen = set()
+        duplicates = []
+        for row_id, user_id, key_id in rows.order_by('-id').values_list('id', 'user_id', key).iterator():
+            if (user_id, key_id) in seen:
+                duplicates.append(row_id)
+            else:
+                seen.add((user_id, key_id))
+
+        for i in range(0, len(duplicates), DELETE_BATCH_SIZE):
+            with transaction.atomic():
+                model.objects.filter(id__in=duplicates[i:i + DELETE_BATCH_SIZE]).delete()
+
+
+def dedup_tracking_rows(apps, schema_editor):
+    dedup(apps.get_model('tracking', 'StatValue'), 'stat_id')
+    dedup(apps.get_model('tracking', 'AchievementStatus'), 'achievement_id')
+    dedup(apps.get_model('tracking', 'InstanceCompletion'), 'instance_id')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('tracking', '0013_instanceschema'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedup_tracking_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0014_dedup_tracking_rows'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='achievementstatus',
+            unique_together={('user', 'achievement')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='instancecompletion',
+            unique_together={('instance', 'user')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='statvalue',
+            unique_together={('user', 'stat')},
+        ),
+        migrations.AddIndex(
+            model_name='achievementstatus',
+            index=models.Index(fields=['user', 'refresh'], name='tracking_ac_user_id_a2a122_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instancecompletion',
+            index=models.Index(fields=['user', 'refresh'], name='tracking_in_user_id_e48eda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statvalue',
+            index=models.Index(fields=['user', 'refresh'], name='tracking_st_user_id_b40cd4_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0015_tracking_constraints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achievementstatus',
+            index=models.Index(fields=['refresh'], name='tracking_ac_refresh_01e2a4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instancecompletion',
+            index=models.Index(fields=['refresh'], name='tracking_in_refresh_53c5d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statvalue',
+            index=models.Index(fields=['refresh'], name='tracking_st_refresh_4e4036_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# Game completions become one rollup row per game, rebuilt here from instance completions
+def rebuild_rollups(apps, schema_editor):
+    GameCompletion = apps.get_model('tracking', 'GameCompletion')
+    InstanceCompletion = apps.get_model('tracking', 'InstanceCompletion')
+
+    GameCompletion.objects.all().delete()
+    rollups = InstanceCompletion.objects.values('instance__game').annotate(total=Sum('percentage'), count=Count('id')).order_by()
+    GameCompletion.objects.bulk_create(
+        [GameCompletion(game_id=row['instance__game'], total=row['total'] or 0, count=row['count'], percentage=(row['total'] or 0) / row['count']) for row in rollups],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0016_refresh_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamecompletion',
+            name='count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gamecompletion',
+            name='total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='gamecompletion',
+            name='game',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='games.game'),
+        ),
+    ]
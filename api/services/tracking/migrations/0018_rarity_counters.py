@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+# Counters start from the existing achievement statuses, reconcile_rarity recounts them later on
+def count_unlocks(apps, schema_editor):
+    Achievement = apps.get_model('tracking', 'Achievement')
+    AchievementStatus = apps.get_model('tracking', 'AchievementStatus')
+    InstanceCounter = apps.get_model('tracking', 'InstanceCounter')
+
+    achievements = list(Achievement.objects.annotate(counted=Count('achievementstatus', filter=Q(achievementstatus__status=True))))
+    for achievement in achievements:
+        achievement.unlocks = achievement.counted
+    Achievement.objects.bulk_update(achievements, ['unlocks'], batch_size=1000)
+
+    unlocks = {}
+    for achievement in achievements:
+        unlocks[achievement.instance_id] = unlocks.get(achievement.instance_id, 0) + achievement.unlocks
+    players = (
+        AchievementStatus.objects.values('achievement__instance_id').annotate(players=Count('user_id', distinct=True))
+        .order_by().values_list('achievement__instance_id', 'players')
+    )
+    InstanceCounter.objects.bulk_create(
+        [InstanceCounter(instance_id=instance_id, players=count, unlocks=unlocks.get(instance_id, 0)) for instance_id, count in players],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+        ('tracking', '0017_gamecompletion_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievement',
+            name='unlocks',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='InstanceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('players', models.IntegerField(default=0)),
+                ('unlocks', models.IntegerField(default=0)),
+                ('instance', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counter', to='games.gameinstance')),
+            ],
+        ),
+        migrations.RunPython(count_unlocks, migrations.RunPython.noop),
+    ]
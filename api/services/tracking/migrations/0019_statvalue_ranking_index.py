@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0018_rarity_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statvalue',
+            index=models.Index(fields=['stat', 'value'], name='tracking_st_stat_id_0a7edf_idx'),
+        ),
+    ]
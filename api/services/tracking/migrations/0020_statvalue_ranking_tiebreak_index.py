@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0019_statvalue_ranking_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='statvalue',
+            name='tracking_st_stat_id_0a7edf_idx',
+        ),
+        migrations.AddIndex(
+            model_name='statvalue',
+            index=models.Index(fields=['stat', 'value', 'id'], name='tracking_st_stat_id_f08472_idx'),
+        ),
+    ]
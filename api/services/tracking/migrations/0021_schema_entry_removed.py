@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0020_statvalue_ranking_tiebreak_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievement',
+            name='removed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stat',
+            name='removed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,15 +1,29 @@
 from django.db import models, transaction
 from services.games.models import GameInstance, Game
-from services.users.models import User
-from datetime import timedelta
+from services.users.models import User, Account
+from django.db.models import Count, Sum, Q, F, FilteredRelation, ExpressionWrapper
+from django.db.models.functions import Greatest
+from collections import defaultdict
+from . import settings
 from django.utils.timezone import now as tznow
 from .track import stat_value, achievement_status
 
+# Schema entries removed upstream are kept with their user rows and hidden, and come
+# back as they were if the upstream schema lists them again
+class SchemaEntryManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(removed__isnull=True)
+
+
 # Stat and its value for a user with updates
 class Stat(models.Model):
     name = models.CharField(max_length=500)
     displayname = models.CharField(max_length=500, null=True, blank=True)
     instance = models.ForeignKey(GameInstance, on_delete=models.CASCADE)
+    removed = models.DateTimeField(null=True, blank=True)
+
+    objects = SchemaEntryManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"{self.name} for {self.instance.game.name} on {self.instance.platform.name}"
@@ -21,15 +35,28 @@ class StatValue(models.Model):
     value = models.FloatField(blank=True, null=True)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
 
+    class Meta:
+        unique_together = ["user", "stat"]
+        indexes = [
+            models.Index(fields=["user", "refresh"]),
+            models.Index(fields=["refresh"]),
+            models.Index(fields=["stat", "value", "id"]),
+        ]
+
     def expired(self):
         return self.refresh < tznow()
     
     def update(self):
         with transaction.atomic():
-            self.refresh = tznow() + timedelta(minutes=30)
-            self.value = stat_value(self)
+            self.refresh = tznow() + settings.REFRESH_INTERVAL
+            account = Account.objects.filter(user=self.user, platform_id=self.stat.instance.platform_id).first()
+            self.value = stat_value(self, account)
             self.save()
 
+        # Imported here as signals are connected to the models of this module
+        from .signals import send_stat_values
+        send_stat_values([self])
+
     def __str__(self):
         return f"{self.stat.name} for {self.user.username} on {self.stat.instance.game.name} on {self.stat.instance.platform.name}"
 
@@ -40,6 +67,11 @@ class Achievement(models.Model):
     displayname = models.CharField(max_length=500, null=True, blank=True)
     instance = models.ForeignKey(GameInstance, on_delete=models.CASCADE)
     icon = models.URLField(null=True, blank=True)
+    unlocks = models.IntegerField(default=0)
+    removed = models.DateTimeField(null=True, blank=True)
+
+    objects = SchemaEntryManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"{self.name} for {self.instance.game.name} on {self.instance.platform.name}"
@@ -51,77 +83,183 @@ class AchievementStatus(models.Model):
     status = models.BooleanField(default=False)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
 
+    class Meta:
+        unique_together = ["user", "achievement"]
+        indexes = [
+            models.Index(fields=["user", "refresh"]),
+            models.Index(fields=["refresh"]),
+        ]
+
     def expired(self):
         return self.refresh < tznow()
     
     def update(self):
         with transaction.atomic():
-            self.refresh = tznow() + timedelta(minutes=30)
-            self.status = achievement_status(self)
+            self.refresh = tznow() + settings.REFRESH_INTERVAL
+            account = Account.objects.filter(user=self.user, platform_id=self.achievement.instance.platform_id).first()
+            status = achievement_status(self, account)
+            flipped = status is not None and status != self.status
+            if status is not None:
+                self.status = status
             self.save()
+            if flipped:
+                InstanceCounter.record(flips=[(self.achievement.instance_id, self.achievement_id, self.status)])
+
+
+# Synced game schema for an instance, version increases whenever the schema changes
+class InstanceSchema(models.Model):
+    instance = models.OneToOneField(GameInstance, on_delete=models.CASCADE, related_name="schema")
+    version = models.PositiveIntegerField(default=0)
+    digest = models.CharField(max_length=64, blank=True)
+    synced = models.DateTimeField(default=tznow)
+    refresh = models.DateTimeField(default=tznow)
+
+    def expired(self):
+        return self.refresh < tznow()
+
+    def __str__(self):
+        return f"Schema v{self.version} for {self.instance.game.name} on {self.instance.platform.name}"
+
+
+# Rarity counters for an instance - players with achievement statuses and unlocks across its achievements
+# Counters only move forward with refreshes: deleting achievement statuses or users leaves players and
+# unlocks counting them until reconcile_rarity recounts the instance, so run it after such deletions
+class InstanceCounter(models.Model):
+    instance = models.OneToOneField(GameInstance, on_delete=models.CASCADE, related_name="counter")
+    players = models.IntegerField(default=0)
+    unlocks = models.IntegerField(default=0)
+
+    # Global completion from the counters and the number of achievements of the instance
+    def completion(self, achievements):
+        if not achievements or self.players <= 0:
+            return 0.0
+        return (self.unlocks / (achievements * self.players)) * 100
+
+    # Unlock percentage of one achievement of the instance
+    def rarity(self, achievement):
+        if self.players <= 0:
+            return 0.0
+        return (achievement.unlocks / self.players) * 100
 
+    # Apply new players as (instance id, user id) pairs and achievement status flips
+    # as (instance id, achievement id, status) triples
+    @classmethod
+    def record(cls, players=(), flips=()):
+        deltas = defaultdict(lambda: [0, 0])
+        unlocks = defaultdict(int)
+        for instance_id, user_id in players:
+            deltas[instance_id][0] += 1
+        for instance_id, achievement_id, status in flips:
+            delta = 1 if status else -1
+            deltas[instance_id][1] += delta
+            unlocks[achievement_id] += delta
 
-# Completion and its percentage for a user, updates if at least 50% of achievement statuses expired
+        # One update per distinct delta rather than per achievement
+        achievements = defaultdict(list)
+        for achievement_id, delta in unlocks.items():
+            if delta:
+                achievements[delta].append(achievement_id)
+        for delta, ids in achievements.items():
+            Achievement.objects.filter(id__in=ids).update(unlocks=F('unlocks') + delta)
+
+        for instance_id, (new_players, new_unlocks) in deltas.items():
+            if not new_players and not new_unlocks:
+                continue
+            cls.objects.get_or_create(instance_id=instance_id)
+            cls.objects.filter(instance_id=instance_id).update(players=F('players') + new_players, unlocks=F('unlocks') + new_unlocks)
+
+    def __str__(self):
+        return f"Counters for {self.instance.game.name} on {self.instance.platform.name}"
+
+
+# Completion and its percentage for a user, achievement statuses refreshed from one snapshot when due
 class InstanceCompletion(models.Model):
     instance = models.ForeignKey(GameInstance, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     percentage = models.FloatField(default=0, blank=True, null=True)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
 
+    class Meta:
+        unique_together = ["instance", "user"]
+        indexes = [
+            models.Index(fields=["user", "refresh"]),
+            models.Index(fields=["refresh"]),
+        ]
+
     def expired(self):
         return self.refresh < tznow()
     
     def update(self):
-        with transaction.atomic():
-            self.refresh = tznow() + timedelta(minutes=30)
-
-            available = Achievement.objects.filter(instance=self.instance)
-            total_achievements = available.count()
-
-            if total_achievements == 0:
-                self.percentage = 0
-                self.save()
-                return
+        # Imported here as ingestion builds on the models above
+        from .ingest import ingest_snapshot, write_due
 
-            expired_statuses = AchievementStatus.objects.filter(
-                achievement__in=available, user=self.user, refresh__lt=tznow()
-            )
-            expired_count = expired_statuses.count()
+        cutoff = tznow()
+        previous = self.percentage or 0
 
-            if expired_count > total_achievements / 2:
-                for status in expired_statuses:
-                    status.update()
+        account = Account.objects.filter(user=self.user, platform_id=self.instance.platform_id).first()
+        if account:
+            ingest_snapshot(self.instance, self.user, account)
 
-            achieved_count = AchievementStatus.objects.filter(
-                achievement__in=available, user=self.user, status=True
-            ).count()
+        counts = (
+            Achievement.objects.filter(instance=self.instance)
+            .annotate(user_status=FilteredRelation('achievementstatus', condition=Q(achievementstatus__user=self.user)))
+            .aggregate(total=Count('id'), achieved=Count('user_status', filter=Q(user_status__status=True)))
+        )
 
-            self.percentage = (achieved_count / total_achievements) * 100
+        self.percentage = (counts['achieved'] / counts['total']) * 100 if counts['total'] else 0
+        self.refresh = tznow() + settings.REFRESH_INTERVAL
+        if self.pk is None:
+            # New completions are added to the game rollup when created
             self.save()
+            return
+
+        # Written only while still due, so when two updaters hold the same row the rollup
+        # only takes the change of the one that wrote it
+        with transaction.atomic():
+            if write_due(InstanceCompletion, [self], 'percentage', models.FloatField(), cutoff, self.refresh):
+                GameCompletion.record([(self.instance.game_id, previous, self.percentage)])
+                return
+        self.refresh_from_db(fields=['percentage', 'refresh'])
 
-# Completion for a game accross instances
+# Completion for a game accross instances, kept as a running sum and count of its instance completions
 class GameCompletion(models.Model):
-    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    game = models.OneToOneField(Game, on_delete=models.CASCADE)
     percentage = models.FloatField(default=0, blank=True, null=True)
+    total = models.FloatField(default=0)
+    count = models.PositiveIntegerField(default=0)
     refresh = models.DateTimeField(default=tznow, blank=True, null=True)
 
     def expired(self):
         return self.refresh < tznow()
 
+    # Rebuild from the instance completions of the game
     def update(self):
-        with transaction.atomic():
-            instance_completions = InstanceCompletion.objects.filter(instance__game=self.game)
-            if not instance_completions.exists():
-                self.percentage = 0
-                self.save()
-                return
+        counts = InstanceCompletion.objects.filter(instance__game=self.game).aggregate(total=Sum('percentage'), count=Count('id'))
+        self.total = counts['total'] or 0
+        self.count = counts['count']
+        self.percentage = self.total / self.count if self.count else 0
+        self.refresh = tznow()
+        self.save()
 
-            total_percentage = sum([completion.percentage for completion in instance_completions])
-            total_instances = instance_completions.count()
+    # Apply (game id, old percentage, new percentage) changes of instance completions,
+    # old is None for a new completion and new is None for a removed one
+    @classmethod
+    def record(cls, changes):
+        deltas = defaultdict(lambda: [0.0, 0])
+        for game_id, old, new in changes:
+            deltas[game_id][0] += (new or 0) - (old or 0)
+            deltas[game_id][1] += (new is not None) - (old is not None)
 
-            self.percentage = total_percentage / total_instances
-            self.refresh = tznow() + timedelta(minutes=30)
-            self.save()
+        for game_id, (total, count) in deltas.items():
+            if not total and not count:
+                continue
+            if count > 0:
+                cls.objects.get_or_create(game_id=game_id)
+            cls.objects.filter(game_id=game_id).update(
+                total=F('total') + total,
+                count=F('count') + count,
+                percentage=ExpressionWrapper((F('total') + total) / Greatest(F('count') + count, 1), output_field=models.FloatField()),
+            )
 
     def __str__(self):
-        return f"{self.game.name} Completion: {self.percentage}%"
\ No newline at end of file
+        return f"{self.game.name} Completion: {self.percentage}%"
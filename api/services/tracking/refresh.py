@@ -0,0 +1,89 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from services.games.models import GameInstance
+from services.users.models import Account, User
+from . import settings
+from .models import InstanceCompletion
+from .ingest import player_rows, ingest_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+# Background refresh worker
+# Due rows served in "stale" mode are refreshed on a small in-process thread pool.
+# A (kind, instance, user) refresh is only queued once while it is pending. With the
+# "scheduler" worker rows are left due for the refresh scheduler command instead.
+
+executor = ThreadPoolExecutor(max_workers=settings.REFRESH_WORKER_THREADS, thread_name_prefix="tracking-refresh")
+pending = set()
+pending_lock = threading.Lock()
+
+
+def enqueue(kind, instance_id, user_id):
+    if settings.REFRESH_WORKER != "thread":
+        return False
+
+    key = (kind, instance_id, user_id)
+    with pending_lock:
+        if key in pending:
+            return False
+        pending.add(key)
+    executor.submit(run, key)
+    return True
+
+
+def run(key):
+    kind, instance_id, user_id = key
+    try:
+        instance = GameInstance.objects.get(id=instance_id)
+        user = User.objects.get(id=user_id)
+        if kind == "snapshot":
+            account = Account.objects.filter(user=user, platform_id=instance.platform_id).first()
+            if account:
+                ingest_snapshot(instance, user, account)
+        elif kind == "completion":
+            InstanceCompletion.objects.get_or_create(instance=instance, user=user)[0].update()
+    except Exception:
+        logger.exception("Background refresh %s failed", key)
+    finally:
+        with pending_lock:
+            pending.discard(key)
+        connection.close()
+
+
+# Serving according to an endpoint's refresh mode
+
+# Stat value & achievement status rows of a user for an instance
+def serve_player_rows(instance, user, account, mode):
+    if mode == "blocking":
+        return ingest_snapshot(instance, user, account)
+
+    statvs, achvs = player_rows(instance, user)
+    if mode == "stale" and any(row.expired() for row in statvs + achvs):
+        enqueue("snapshot", instance.id, user.id)
+    return statvs, achvs
+
+# Completion of a user for an instance
+def serve_completion(instance, user, mode):
+    completion, created = InstanceCompletion.objects.get_or_create(instance=instance, user=user)
+
+    if created or completion.expired():
+        if mode == "blocking":
+            completion.update()
+        elif mode == "stale":
+            enqueue("completion", instance.id, user.id)
+    return completion
+
+# Completions of a user for many instances by instance id, instances without one are
+# left out. Refreshing in the request would take a fetch per instance, so in "blocking"
+# mode as in "stale" due and missing completions are refreshed in the background
+def serve_completions(instances, user, mode):
+    completions = {comp.instance_id: comp for comp in InstanceCompletion.objects.filter(user=user, instance__in=instances)}
+    if mode != "cache":
+        for instance in instances:
+            completion = completions.get(instance.id)
+            if completion is None or completion.expired():
+                enqueue("completion", instance.id, user.id)
+    return completions
@@ -1,6 +1,7 @@
 from ninja import Schema, ModelSchema
 from .models import Stat, StatValue, Achievement, AchievementStatus, InstanceCompletion, GameCompletion
 from datetime import datetime
+from typing import Optional
 
 # Statistic schemas
 class FullStatSchema(ModelSchema):
@@ -15,11 +16,16 @@ class StatSchema(Schema):
     
 class StatValueSchema(ModelSchema):
     stat: StatSchema 
+    stale: bool
 
     class Meta:
         model = StatValue
         fields = "__all__"
 
+    @staticmethod
+    def resolve_stale(obj):
+        return obj.expired()
+
 
 # Achievement schemas
 class FullAchievementSchema(ModelSchema):
@@ -33,15 +39,45 @@ class AchievementSchema(Schema):
     displayname: str
     icon: str
 
+class AchievementRaritySchema(AchievementSchema):
+    unlocks: int
+    percentage: float
+
 class AchievementStatusSchema(ModelSchema):
     achievement: AchievementSchema 
+    stale: bool
 
     class Meta:
         model = AchievementStatus
         fields = "__all__"
 
+    @staticmethod
+    def resolve_stale(obj):
+        return obj.expired()
+
 
 # Completion Schemas
 class CompletionSchema(Schema):
     percentage: float
     refresh: datetime = None
+
+class UserCompletionSchema(CompletionSchema):
+    stale: bool
+
+    @staticmethod
+    def resolve_stale(obj):
+        return obj.expired()
+
+
+# Tracking summary schemas
+class InstanceSummarySchema(Schema):
+    instance: int
+    achievements: int
+    unlocked: int
+    percentage: Optional[float] = None
+    refresh: Optional[datetime] = None
+    stale: bool
+
+class TrackingSummarySchema(Schema):
+    items: list[InstanceSummarySchema]
+    missing: list[int]
@@ -0,0 +1,58 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+
+# Schema options
+SCHEMA_TTL = timedelta(days=1)
+SCHEMA_CACHE_DIR = settings.BASE_DIR / "cache" / "schemas"
+
+# Steam client options
+# The Web API key is read from the STEAM_KEY environment variable. STEAM_BASE_URL can be
+# pointed at a local stand-in server for tests and benchmarks
+STEAM_KEY = os.environ.get("STEAM_KEY", "")
+STEAM_BASE_URL = os.environ.get("STEAM_BASE_URL", "https://api.steampowered.com/")
+STEAM_POOL_SIZE = 10
+STEAM_CONNECT_TIMEOUT = 3.05
+STEAM_READ_TIMEOUT = 10
+STEAM_RETRIES = 2
+STEAM_BACKOFF = 0.5
+
+# Refresh options
+# How long refreshed stat values, achievement statuses and completions stay fresh
+REFRESH_INTERVAL = timedelta(minutes=30)
+# Rows and schemas whose upstream fetch failed are fetched again after this delay
+FETCH_RETRY = timedelta(minutes=5)
+# Most rows written by one update, keeps each update within the database's limit on query parameters
+WRITE_BATCH_SIZE = 250
+
+# Per endpoint refresh mode for user endpoints:
+# "blocking" - refresh due rows before responding
+# "stale" - respond with cached rows and refresh due rows in the background
+# "cache" - respond with cached rows only
+# Every endpoint refreshes before responding by default, "stale" is opt-in as a first
+# visit then responds with rows that were never fetched
+REFRESH_MODES = {
+    "stats": "blocking",
+    "achievements": "blocking",
+    "completion": "blocking",
+}
+# Where "stale" refreshes run:
+# "thread" - an in-process worker pool
+# "scheduler" - left due for the refresh scheduler command
+REFRESH_WORKER = "thread"
+REFRESH_WORKER_THREADS = 4
+
+# Scheduler options
+# Upstream calls per minute shared by everything the scheduler refreshes
+SCHEDULER_BUDGET = 120
+SCHEDULER_BATCH_SIZE = 50
+# Seconds to wait when nothing is due
+SCHEDULER_IDLE = 5
+# Rows that could not be refreshed are retried after this delay
+SCHEDULER_RETRY = timedelta(minutes=5)
+# Rows of users seen within this window are refreshed first, as are rows a board tracks for its players
+SCHEDULER_SEEN_WINDOW = timedelta(days=1)
+
+# Summary options
+# Most instances a tracking summary covers
+SUMMARY_MAX_INSTANCES = 300
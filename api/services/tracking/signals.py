@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import Signal, receiver
+from .models import StatValue, InstanceCompletion, GameCompletion
+
+
+# Sent with (row id, user id, stat id, value) tuples of stat values once their write commits,
+# bulk and queryset writes skip post_save so writers send it themselves
+stat_values_written = Signal()
+
+def send_stat_values(statvs):
+    rows = [(statv.id, statv.user_id, statv.stat_id, statv.value) for statv in statvs]
+    if rows:
+        transaction.on_commit(lambda: stat_values_written.send(sender=StatValue, rows=rows))
+
+
+
+# Keep game completion rollups in step with instance completions being added and removed
+@receiver(post_save, sender=InstanceCompletion)
+def completion_created(sender, instance, created, **kwargs):
+    if created:
+        GameCompletion.record([(instance.instance.game_id, None, instance.percentage or 0)])
+
+@receiver(pre_delete, sender=InstanceCompletion)
+def completion_removed(sender, instance, **kwargs):
+    GameCompletion.record([(instance.instance.game_id, instance.percentage or 0, None)])
@@ -0,0 +1,66 @@
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from . import settings
+
+# Statuses worth retrying, anything else is returned to the caller as a failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SteamError(requests.RequestException):
+    pass
+
+
+# Steam Web API client
+# Keeps a pool of keep-alive connections, bounds every call with connect and read
+# timeouts and retries transient failures with jittered exponential backoff.
+class SteamClient:
+    def __init__(self, base_url=None, key=None, pool_size=None, connect_timeout=None, read_timeout=None, retries=None, backoff=None):
+        self.base_url = (base_url or settings.STEAM_BASE_URL).rstrip("/")
+        self.key = key or settings.STEAM_KEY
+        self.timeout = (connect_timeout or settings.STEAM_CONNECT_TIMEOUT, read_timeout or settings.STEAM_READ_TIMEOUT)
+        self.retries = settings.STEAM_RETRIES if retries is None else retries
+        self.backoff = settings.STEAM_BACKOFF if backoff is None else backoff
+
+        pool_size = pool_size or settings.STEAM_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def sleep(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    # GET an API method and return its decoded JSON body, e.g. get("ISteamUserStats", "GetSchemaForGame/v2", appid=730)
+    def get(self, interface, method, **params):
+        url = f"{self.base_url}/{interface}/{method}"
+        params = {"key": self.key, **params}
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise SteamError(f"{method} failed: {e}") from e
+                self.sleep(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self.sleep(attempt)
+                continue
+
+            if response.status_code != 200:
+                raise SteamError(f"{method} returned {response.status_code}", response=response)
+
+            try:
+                return response.json()
+            except ValueError as e:
+                raise SteamError(f"{method} returned an invalid body", response=response) from e
+
+    def close(self):
+        self.session.close()
+
+
+# Shared client, replace to point tracking at another server
+client = SteamClient()
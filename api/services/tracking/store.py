@@ -0,0 +1,114 @@
+import json
+import hashlib
+from datetime import datetime
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now as tznow
+from . import settings
+from .models import Stat, Achievement, InstanceSchema, InstanceCounter
+from .track import game_schema
+
+
+# Game schema store
+# The schema of an instance is fetched once and used to populate both its stats
+# and achievements. It is re-synced once its TTL passes, only new, changed, removed or
+# relisted entries are written and the parsed schema is kept on disk between restarts.
+
+# On disk copy of a parsed schema
+def cache_path(instance):
+    return settings.SCHEMA_CACHE_DIR / f"{instance.id}.json"
+
+# A missing, expired or malformed copy is a miss
+def read_cached_schema(instance):
+    try:
+        with open(cache_path(instance), encoding='utf-8') as f:
+            cached = json.load(f)
+        if datetime.fromisoformat(cached['fetched']) + settings.SCHEMA_TTL < tznow():
+            return None
+        schema = cached['schema']
+        if not isinstance(schema['stats'], list) or not isinstance(schema['achievements'], list):
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return schema
+
+def write_cached_schema(instance, schema):
+    settings.SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(cache_path(instance), 'w', encoding='utf-8') as f:
+        json.dump({'fetched': tznow().isoformat(), 'schema': schema}, f)
+
+
+def schema_digest(schema):
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+# Insert new, update changed, hide removed and restore relisted rows of a model from schema
+# entries, matched by name. Returns the rows hidden and the rows restored. Removed entries are
+# only hidden, so a truncated upstream schema leaves user rows and board links in place, and an
+# empty list of entries is taken as an incomplete schema that hides nothing
+def merge_entries(model, instance, entries, fields):
+    existing = {row.name: row for row in model.all_objects.filter(instance=instance)}
+
+    to_add = []
+    to_update = []
+    restored = []
+    for entry in entries:
+        row = existing.get(entry['name'])
+        if row is None:
+            to_add.append(model(instance=instance, **entry))
+        elif row.removed is not None or any(getattr(row, field) != entry[field] for field in fields):
+            if row.removed is not None:
+                row.removed = None
+                restored.append(row)
+            for field in fields:
+                setattr(row, field, entry[field])
+            to_update.append(row)
+
+    names = {entry['name'] for entry in entries}
+    hidden = [row for name, row in existing.items() if name not in names and row.removed is None] if entries else []
+    for row in hidden:
+        row.removed = tznow()
+
+    model.objects.bulk_create(to_add)
+    model.all_objects.bulk_update(to_update + hidden, fields + ['removed'])
+    return hidden, restored
+
+
+# Sync stats and achievements of an instance with its schema
+def sync_schema(instance, force=False):
+    current = InstanceSchema.objects.filter(instance=instance).first()
+    if current and not current.expired() and not force:
+        return current
+
+    schema = None if force else read_cached_schema(instance)
+    if schema is None:
+        schema = game_schema(instance)
+        if schema is None:
+            # Failed fetches are retried after FETCH_RETRY rather than on every request
+            current, created = InstanceSchema.objects.get_or_create(instance=instance)
+            current.refresh = tznow() + settings.FETCH_RETRY
+            InstanceSchema.objects.filter(id=current.id).update(refresh=current.refresh)
+            return current
+        write_cached_schema(instance, schema)
+
+    digest = schema_digest(schema)
+    with transaction.atomic():
+        # Concurrent first syncs share the one schema row, and whichever locks it
+        # second finds the entries merged already
+        current, created = InstanceSchema.objects.select_for_update().get_or_create(instance=instance)
+
+        if current.digest != digest:
+            merge_entries(Stat, instance, schema['stats'], ['displayname'])
+            hidden, restored = merge_entries(Achievement, instance, schema['achievements'], ['displayname', 'icon'])
+            # Unlocks of hidden achievements leave the instance counters while they are hidden
+            unlocks = sum(achievement.unlocks for achievement in hidden) - sum(achievement.unlocks for achievement in restored)
+            if unlocks:
+                InstanceCounter.objects.filter(instance=instance).update(unlocks=F('unlocks') - unlocks)
+            current.version += 1
+            current.digest = digest
+
+        current.synced = tznow()
+        current.refresh = current.synced + settings.SCHEMA_TTL
+        current.save()
+
+    return current
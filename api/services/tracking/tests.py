@@ -1,3 +1,544 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from importlib import import_module
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as tznow
+from authentication.utility import generate_token
+from services.games.models import Platform, Game, GameInstance
+from services.users.models import User, Account
+from services.boards.refresh import write_chunk, achievement_status_rows
+from services.boards.models import AchievementBoard, AchievementBoardPlayer
+from .models import Stat, StatValue, Achievement, AchievementStatus, InstanceSchema, InstanceCounter, InstanceCompletion, GameCompletion
+from .ingest import record_players, player_rows, apply_snapshot, write_snapshot, ingest_snapshot
+from .store import sync_schema, cache_path
+from .management.commands.refresh import Queue
+from . import settings
 
-# Create your tests here.
+
+# Runs the tracking migrations up to `migrate_from`, the test seeds rows with the
+# historical models of that state and migrates on to `migrate_to`
+class MigrationTestCase(TransactionTestCase):
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.migrate(self.migrate_from)
+        self.platform = Platform.objects.create(name="Steam")
+        self.games = [Game.objects.create(id=i + 1, name=f"Game {i}") for i in range(2)]
+        self.instances = [GameInstance.objects.create(game=game, platform=self.platform, uid=str(game.id)) for game in self.games]
+        self.users = [User.objects.create_user(username=f"user{i}", password="password") for i in range(5)]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("tracking", name)])
+        self.apps = executor.loader.project_state([("tracking", name)]).apps
+
+    def model(self, name):
+        return self.apps.get_model("tracking", name)
+
+
+class DedupMigrationTest(MigrationTestCase):
+    migrate_from = "0013_instanceschema"
+    migrate_to = "0014_dedup_tracking_rows"
+
+    def test_keeps_newest_row_of_every_group(self):
+        Stat = self.model("Stat")
+        StatValue = self.model("StatValue")
+        Achievement = self.model("Achievement")
+        AchievementStatus = self.model("AchievementStatus")
+        InstanceCompletion = self.model("InstanceCompletion")
+
+        stats = [Stat.objects.create(name=f"stat{i}", instance_id=self.instances[0].id) for i in range(2)]
+        achievement = Achievement.objects.create(name="achievement", instance_id=self.instances[0].id)
+
+        kept = {StatValue: [], AchievementStatus: [], InstanceCompletion: []}
+        for user in self.users:
+            for stat in stats:
+                rows = [StatValue.objects.create(user_id=user.id, stat_id=stat.id, value=value) for value in range(3)]
+                kept[StatValue].append(rows[-1].id)
+            rows = [AchievementStatus.objects.create(user_id=user.id, achievement_id=achievement.id, status=status) for status in (True, False)]
+            kept[AchievementStatus].append(rows[-1].id)
+            rows = [InstanceCompletion.objects.create(user_id=user.id, instance_id=self.instances[1].id, percentage=percentage) for percentage in (10, 20)]
+            kept[InstanceCompletion].append(rows[-1].id)
+
+        # Small windows so the users span several of them
+        migration = import_module("services.tracking.migrations.0014_dedup_tracking_rows")
+        with mock.patch.object(migration, "USERS_PER_WINDOW", 2), mock.patch.object(migration, "DELETE_BATCH_SIZE", 3):
+            self.migrate(self.migrate_to)
+
+        for model, ids in kept.items():
+            self.assertEqual(sorted(model.objects.values_list("id", flat=True)), sorted(ids))
+        self.assertEqual(set(StatValue.objects.values_list("value", flat=True)), {2})
+        self.assertFalse(AchievementStatus.objects.filter(status=True).exists())
+
+    def test_empty_tables(self):
+        self.migrate(self.migrate_to)
+        self.assertFalse(self.model("StatValue").objects.exists())
+
+
+class RollupMigrationTest(MigrationTestCase):
+    migrate_from = "0016_refresh_indexes"
+    migrate_to = "0017_gamecompletion_rollup"
+
+    def test_rebuilds_rollups_from_instance_completions(self):
+        InstanceCompletion = self.model("InstanceCompletion")
+        GameCompletion = self.model("GameCompletion")
+
+        InstanceCompletion.objects.create(user_id=self.users[0].id, instance_id=self.instances[0].id, percentage=50)
+        InstanceCompletion.objects.create(user_id=self.users[1].id, instance_id=self.instances[0].id, percentage=100)
+        InstanceCompletion.objects.create(user_id=self.users[2].id, instance_id=self.instances[0].id, percentage=None)
+        GameCompletion.objects.create(game_id=self.games[0].id, percentage=10)
+        GameCompletion.objects.create(game_id=self.games[1].id, percentage=10)
+
+        self.migrate(self.migrate_to)
+
+        GameCompletion = self.model("GameCompletion")
+        rollup = GameCompletion.objects.get()
+        self.assertEqual(rollup.game_id, self.games[0].id)
+        self.assertEqual((rollup.total, rollup.count, rollup.percentage), (150, 3, 50))
+
+
+class RarityMigrationTest(MigrationTestCase):
+    migrate_from = "0017_gamecompletion_rollup"
+    migrate_to = "0018_rarity_counters"
+
+    def test_counts_unlocks_and_players(self):
+        Achievement = self.model("Achievement")
+        AchievementStatus = self.model("AchievementStatus")
+
+        achievements = [Achievement.objects.create(name=f"achievement{i}", instance_id=self.instances[0].id) for i in range(3)]
+        Achievement.objects.create(name="unseen", instance_id=self.instances[1].id)
+        for user, unlocked in zip(self.users, (3, 1, 0)):
+            for index, achievement in enumerate(achievements):
+                AchievementStatus.objects.create(user_id=user.id, achievement_id=achievement.id, status=index < unlocked)
+
+        self.migrate(self.migrate_to)
+
+        Achievement = self.model("Achievement")
+        InstanceCounter = self.model("InstanceCounter")
+        self.assertEqual(list(Achievement.objects.filter(instance_id=self.instances[0].id).order_by("id").values_list("unlocks", flat=True)), [2, 1, 1])
+        counter = InstanceCounter.objects.get()
+        self.assertEqual((counter.instance_id, counter.players, counter.unlocks), (self.instances[0].id, 3, 4))
+
+
+class TrackingTestCase(TestCase):
+    def setUp(self):
+        self.platform = Platform.objects.create(name="Steam")
+        self.game = Game.objects.create(id=1, name="Game")
+        self.instance = GameInstance.objects.create(game=self.game, platform=self.platform, uid="1")
+        self.achievements = [Achievement.objects.create(name=f"achievement{i}", instance=self.instance) for i in range(3)]
+        self.users = [User.objects.create_user(username=f"user{i}", password="password") for i in range(3)]
+
+    # Snapshot unlocking the achievements at `unlocked` indexes
+    def snapshot(self, *unlocked):
+        return {"stats": {}, "achievements": {self.achievements[index].name: True for index in unlocked}}
+
+    # Make every tracking row due again
+    def expire(self):
+        AchievementStatus.objects.update(refresh=tznow() - timedelta(days=1))
+        InstanceCompletion.objects.update(refresh=tznow() - timedelta(days=1))
+
+
+class InstanceCounterTest(TrackingTestCase):
+    def refresh(self, user, *unlocked):
+        statvs, achvs = player_rows(self.instance, user)
+        cutoff = tznow()
+        return write_snapshot(cutoff, *apply_snapshot(self.snapshot(*unlocked), statvs, achvs, cutoff))
+
+    def counters(self):
+        counter = InstanceCounter.objects.get(instance=self.instance)
+        unlocks = list(Achievement.objects.filter(instance=self.instance).order_by("id").values_list("unlocks", flat=True))
+        return counter.players, counter.unlocks, unlocks
+
+    def assertReconciled(self):
+        counters = self.counters()
+        call_command("reconcile_rarity", stdout=StringIO())
+        self.assertEqual(self.counters(), counters)
+
+    def test_flips_move_counters(self):
+        self.refresh(self.users[0], 0, 1)
+        self.refresh(self.users[1], 0)
+        self.refresh(self.users[2])
+        self.assertEqual(self.counters(), (3, 3, [2, 1, 0]))
+
+        counter = InstanceCounter.objects.get(instance=self.instance)
+        achievements = Achievement.objects.filter(instance=self.instance).order_by("id")
+        self.assertAlmostEqual(counter.rarity(achievements[0]), 200 / 3)
+        self.assertAlmostEqual(counter.completion(len(self.achievements)), 100 / 3)
+        self.assertReconciled()
+
+        # Relocks and unlocks on a later refresh, players are only counted once
+        self.expire()
+        self.refresh(self.users[0], 2)
+        self.refresh(self.users[1], 0)
+        self.assertEqual(self.counters(), (3, 2, [1, 0, 1]))
+        self.assertReconciled()
+
+    # Two first refreshes that both found the user without statuses before either inserted any
+    def test_racing_first_refreshes_count_player_once(self):
+        record_players([(self.instance.id, self.users[0].id)])
+        record_players([(self.instance.id, self.users[0].id)])
+        player_rows(self.instance, self.users[0])
+        achievement_status_rows([(achievement, self.users[0].id) for achievement in self.achievements])
+        self.assertEqual(self.counters(), (1, 0, [0, 0, 0]))
+
+        achievement_status_rows([(self.achievements[2], self.users[1].id)])
+        player_rows(self.instance, self.users[1])
+        self.assertEqual(self.counters(), (2, 0, [0, 0, 0]))
+        self.assertReconciled()
+
+    def test_flips_take_a_fixed_number_of_queries(self):
+        self.achievements += [Achievement.objects.create(name=f"achievement{i}", instance=self.instance) for i in range(3, 20)]
+        queries = []
+        for user, unlocked in [(self.users[0], range(2)), (self.users[1], range(18))]:
+            statvs, achvs = player_rows(self.instance, user)
+            cutoff = tznow()
+            applied = apply_snapshot(self.snapshot(*unlocked), statvs, achvs, cutoff)
+            with CaptureQueriesContext(connection) as captured:
+                write_snapshot(cutoff, *applied)
+            queries.append(len(captured))
+
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(self.counters(), (2, 20, [2, 2] + [1] * 16 + [0, 0]))
+        self.assertReconciled()
+
+    def test_writes_are_batched(self):
+        self.achievements += [Achievement.objects.create(name=f"achievement{i}", instance=self.instance) for i in range(3, 7)]
+        with mock.patch.object(settings, "WRITE_BATCH_SIZE", 2):
+            self.refresh(self.users[0], 0, 1, 2)
+            self.expire()
+            statvs, achvs = self.refresh(self.users[0], 3, 4, 5, 6)
+        self.assertEqual(len(achvs), 7)
+        self.assertEqual(self.counters(), (1, 4, [0, 0, 0, 1, 1, 1, 1]))
+        self.assertReconciled()
+
+    def test_failed_fetch_is_retried_later(self):
+        account = Account.objects.create(user=self.users[0], platform=self.platform, uid="1")
+        with mock.patch("services.tracking.ingest.player_snapshot", return_value=None) as fetch:
+            ingest_snapshot(self.instance, self.users[0], account)
+            ingest_snapshot(self.instance, self.users[0], account)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertFalse(AchievementStatus.objects.filter(refresh__lt=tznow() + settings.FETCH_RETRY - timedelta(minutes=1)).exists())
+
+    # Rows another refresh wrote during the fetch are returned as stored
+    def test_skipped_rows_are_read_back(self):
+        stat = Stat.objects.create(name="kills", instance=self.instance)
+        account = Account.objects.create(user=self.users[0], platform=self.platform, uid="1")
+        player_rows(self.instance, self.users[0])
+
+        def fetched_elsewhere(instance, account):
+            StatValue.objects.filter(stat=stat).update(value=42, refresh=tznow() + timedelta(hours=1))
+            AchievementStatus.objects.filter(achievement=self.achievements[1]).update(status=True, refresh=tznow() + timedelta(hours=1))
+            return {"stats": {"kills": 7}, "achievements": {self.achievements[0].name: True}}
+
+        self.expire()
+        StatValue.objects.update(refresh=tznow() - timedelta(days=1))
+        with mock.patch("services.tracking.ingest.player_snapshot", side_effect=fetched_elsewhere):
+            statvs, achvs = ingest_snapshot(self.instance, self.users[0], account)
+
+        self.assertEqual([statv.value for statv in statvs], [42])
+        self.assertEqual({achv.achievement.name: achv.status for achv in achvs}, dict(AchievementStatus.objects.values_list("achievement__name", "status")))
+        self.assertEqual(sum(achv.status for achv in achvs), 2)
+
+    def test_rows_not_due_are_not_written(self):
+        self.refresh(self.users[0], 0)
+        statvs, achvs = self.refresh(self.users[0], 1)
+        self.assertEqual(achvs, [])
+        self.assertEqual(self.counters(), (1, 1, [1, 0, 0]))
+
+    # Two refreshes read the same due rows and both see the same unlock
+    def test_concurrent_refresh_counts_flip_once(self):
+        self.refresh(self.users[0])
+        self.expire()
+
+        first = player_rows(self.instance, self.users[0])
+        second = player_rows(self.instance, self.users[0])
+        cutoff = tznow()
+        first = apply_snapshot(self.snapshot(0), *first, cutoff)
+        second = apply_snapshot(self.snapshot(0), *second, cutoff)
+
+        self.assertEqual(len(write_snapshot(cutoff, *first)[1]), 3)
+        self.assertEqual(len(write_snapshot(cutoff, *second)[1]), 0)
+        self.assertEqual(self.counters(), (1, 1, [1, 0, 0]))
+        self.assertReconciled()
+
+    def test_concurrent_board_refresh_counts_flip_once(self):
+        self.refresh(self.users[0])
+        self.refresh(self.users[1], 1)
+        self.expire()
+
+        rows = [list(AchievementStatus.objects.select_related("achievement")) for _ in range(2)]
+        cutoff = tznow()
+        for achvs in rows:
+            write_chunk([(self.snapshot(0), ([], achvs, []))], {}, cutoff)
+        self.assertEqual(self.counters(), (2, 2, [2, 0, 0]))
+        self.assertReconciled()
+
+
+class RefreshModeTest(TrackingTestCase):
+    def test_first_visit_is_fetched_by_default(self):
+        Stat.objects.create(name="kills", displayname="Kills", instance=self.instance)
+        Account.objects.create(user=self.users[0], platform=self.platform, uid="1")
+        token = generate_token(self.users[0], "access")
+
+        snapshot = {"stats": {"kills": 7}, "achievements": {}}
+        with mock.patch("services.tracking.ingest.player_snapshot", return_value=snapshot):
+            response = self.client.get(f"/api/track/stats/{self.instance.id}/user/0", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(statv["value"], statv["stale"]) for statv in response.json()], [(7, False)])
+
+
+class SummaryTest(TrackingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = GameInstance.objects.create(game=Game.objects.create(id=2, name="Other"), platform=self.platform, uid="2")
+        for achievement, status in zip(self.achievements, (True, True, False)):
+            AchievementStatus.objects.create(user=self.users[0], achievement=achievement, status=status)
+        InstanceCompletion.objects.create(instance=self.instance, user=self.users[0], percentage=200 / 3, refresh=tznow() + timedelta(hours=1))
+        self.token = generate_token(self.users[0], "access")
+
+    def summary(self, instances):
+        return self.client.get(f"/api/track/summary/user/0?instances={instances}", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_completions_across_instances(self):
+        with mock.patch("services.tracking.refresh.enqueue") as enqueue:
+            data = self.summary(f"{self.other.id},999,{self.instance.id}").json()
+
+        self.assertEqual(data["missing"], [999])
+        self.assertEqual([(item["instance"], item["achievements"], item["unlocked"], item["stale"]) for item in data["items"]], [
+            (self.other.id, 0, 0, True),
+            (self.instance.id, 3, 2, False),
+        ])
+        self.assertIsNone(data["items"][0]["percentage"])
+        self.assertAlmostEqual(data["items"][1]["percentage"], 200 / 3)
+        # Only the missing completion is refreshed, in the background
+        enqueue.assert_called_once_with("completion", self.other.id, self.users[0].id)
+
+    def test_invalid_instances(self):
+        self.assertEqual(self.summary("1,x").status_code, 400)
+        self.assertEqual(self.summary(",".join(str(i) for i in range(settings.SUMMARY_MAX_INSTANCES + 1))).status_code, 400)
+
+
+class GameCompletionTest(TrackingTestCase):
+    def rollup(self):
+        rollup = GameCompletion.objects.get(game=self.game)
+        return rollup.total, rollup.count, rollup.percentage
+
+    def assertRebuilt(self):
+        rollup = self.rollup()
+        GameCompletion.objects.get(game=self.game).update()
+        self.assertEqual(self.rollup(), rollup)
+
+    def test_record_changes(self):
+        GameCompletion.record([(self.game.id, None, 50), (self.game.id, None, 100)])
+        self.assertEqual(self.rollup(), (150, 2, 75))
+
+        GameCompletion.record([(self.game.id, 50, 0)])
+        self.assertEqual(self.rollup(), (100, 2, 50))
+
+        GameCompletion.record([(self.game.id, 100, None)])
+        self.assertEqual(self.rollup(), (0, 1, 0))
+
+        GameCompletion.record([(self.game.id, 0, None)])
+        self.assertEqual(self.rollup(), (0, 0, 0))
+
+    def test_completions_added_and_removed(self):
+        completions = [InstanceCompletion.objects.create(instance=self.instance, user=user, percentage=percentage) for user, percentage in zip(self.users, (20, 40, 60))]
+        self.assertEqual(self.rollup(), (120, 3, 40))
+        self.assertRebuilt()
+
+        completions[0].delete()
+        self.assertEqual(self.rollup(), (100, 2, 50))
+        self.assertRebuilt()
+
+    # The stale worker and a request updating the same completion
+    def test_concurrent_updates_record_once(self):
+        InstanceCompletion.objects.create(instance=self.instance, user=self.users[0], percentage=0)
+        for achievement in self.achievements:
+            AchievementStatus.objects.create(user=self.users[0], achievement=achievement, status=True, refresh=tznow() + timedelta(hours=1))
+        self.expire()
+
+        completions = [InstanceCompletion.objects.select_related("instance").get() for _ in range(2)]
+        for completion in completions:
+            completion.update()
+        self.assertEqual(self.rollup(), (100, 1, 100))
+        self.assertEqual(completions[1].refresh, completions[0].refresh)
+        self.assertRebuilt()
+
+    def test_concurrent_board_refresh_records_once(self):
+        InstanceCompletion.objects.create(instance=self.instance, user=self.users[0], percentage=0)
+        self.expire()
+
+        names = {self.instance.id: [achievement.name for achievement in self.achievements]}
+        rows = [list(InstanceCompletion.objects.select_related("instance")) for _ in range(2)]
+        cutoff = tznow()
+        for completions in rows:
+            write_chunk([(self.snapshot(0, 1, 2), ([], [], completions))], names, cutoff)
+        self.assertEqual(self.rollup(), (100, 1, 100))
+        self.assertRebuilt()
+
+
+class CompletionUpdateTest(TrackingTestCase):
+    def update(self, user, *unlocked):
+        completion = InstanceCompletion.objects.select_related("instance").get_or_create(instance=self.instance, user=user)[0]
+        with mock.patch("services.tracking.ingest.player_snapshot", return_value=self.snapshot(*unlocked)) as fetch:
+            with CaptureQueriesContext(connection) as captured:
+                completion.update()
+        return completion, fetch.call_count, len(captured)
+
+    # One snapshot refreshes every status and one aggregate counts them, however many achievements there are
+    def test_one_fetch_and_a_fixed_number_of_queries(self):
+        for user in self.users:
+            Account.objects.create(user=user, platform=self.platform, uid=str(user.id))
+        # The first update creates the instance counter
+        self.update(self.users[2])
+
+        completion, fetches, queries = self.update(self.users[0], 0)
+        self.assertEqual(fetches, 1)
+        self.assertAlmostEqual(completion.percentage, 100 / 3)
+
+        self.achievements += [Achievement.objects.create(name=f"achievement{i}", instance=self.instance) for i in range(3, 20)]
+        completion, fetches, more_queries = self.update(self.users[1], 0, 1, 2, 3, 4)
+        self.assertEqual(fetches, 1)
+        self.assertEqual(completion.percentage, 25)
+        self.assertEqual(more_queries, queries)
+
+    def test_without_account_counts_stored_statuses(self):
+        AchievementStatus.objects.create(user=self.users[0], achievement=self.achievements[1], status=True)
+        completion, fetches, queries = self.update(self.users[0])
+        self.assertEqual(fetches, 0)
+        self.assertAlmostEqual(completion.percentage, 100 / 3)
+
+
+class SchemaStoreTest(TrackingTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(settings, "SCHEMA_CACHE_DIR", Path(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def schema(self, stats, achievements):
+        return {
+            "stats": [{"name": name, "displayname": name.title()} for name in stats],
+            "achievements": [{"name": name, "displayname": name.title(), "icon": None} for name in achievements],
+        }
+
+    def sync(self, schema, force=False):
+        with mock.patch("services.tracking.store.game_schema", return_value=schema) as fetch:
+            sync_schema(self.instance, force=force)
+        return fetch.call_count
+
+    def test_malformed_cache_is_a_miss(self):
+        schema = self.schema(["kills"], ["achievement0"])
+        self.sync(schema)
+        for cached in [
+            "{",
+            "[]",
+            json.dumps({"schema": schema}),
+            json.dumps({"fetched": "yesterday", "schema": schema}),
+            json.dumps({"fetched": tznow().isoformat(), "schema": {"stats": []}}),
+        ]:
+            cache_path(self.instance).write_text(cached)
+            InstanceSchema.objects.filter(instance=self.instance).update(refresh=tznow() - timedelta(days=1))
+            self.assertEqual(self.sync(schema), 1, cached)
+
+        # A valid copy is read instead of fetching
+        InstanceSchema.objects.filter(instance=self.instance).update(refresh=tznow() - timedelta(days=1))
+        self.assertEqual(self.sync(schema), 0)
+
+    def test_failed_fetch_is_retried_later(self):
+        self.assertEqual(self.sync(None), 1)
+        self.assertEqual(self.sync(None), 0)
+
+        InstanceSchema.objects.filter(instance=self.instance).update(refresh=tznow() - timedelta(seconds=1))
+        self.assertEqual(self.sync(self.schema(["kills"], [])), 1)
+        self.assertEqual(InstanceSchema.objects.get(instance=self.instance).version, 1)
+
+    def test_entries_removed_upstream_are_hidden(self):
+        self.sync(self.schema(["kills", "deaths"], ["achievement0", "achievement1", "achievement2"]), force=True)
+        achievement = Achievement.objects.get(instance=self.instance, name="achievement2")
+        AchievementStatus.objects.create(user=self.users[0], achievement=achievement, status=True)
+        InstanceCounter.record(players=[(self.instance.id, self.users[0].id)], flips=[(self.instance.id, achievement.id, True)])
+
+        # A truncated schema keeps the rows of the entries it leaves out
+        self.sync(self.schema(["kills"], ["achievement0", "achievement1"]), force=True)
+        self.assertEqual(list(Stat.objects.filter(instance=self.instance).values_list("name", flat=True)), ["kills"])
+        self.assertEqual(sorted(Achievement.objects.filter(instance=self.instance).values_list("name", flat=True)), ["achievement0", "achievement1"])
+        self.assertEqual(Achievement.all_objects.filter(instance=self.instance, removed__isnull=False).get(), achievement)
+        self.assertTrue(AchievementStatus.objects.filter(achievement=achievement, status=True).exists())
+        self.assertEqual(InstanceCounter.objects.get(instance=self.instance).unlocks, 0)
+
+        # Entries listed again come back with their unlocks
+        self.sync(self.schema(["kills", "deaths"], ["achievement0", "achievement1", "achievement2"]), force=True)
+        self.assertEqual(Stat.objects.filter(instance=self.instance).count(), 2)
+        self.assertEqual(Achievement.objects.get(instance=self.instance, name="achievement2"), achievement)
+        self.assertEqual(InstanceCounter.objects.get(instance=self.instance).unlocks, 1)
+
+        # An empty list is not taken as every entry being removed
+        self.sync(self.schema([], ["achievement0"]), force=True)
+        self.assertEqual(Stat.objects.filter(instance=self.instance).count(), 2)
+
+    def test_concurrent_first_sync(self):
+        # Another sync creates the schema row after this one found none
+        def created_elsewhere(instance):
+            InstanceSchema.objects.create(instance=instance)
+
+        with mock.patch("services.tracking.store.read_cached_schema", side_effect=created_elsewhere):
+            self.sync(self.schema(["kills"], ["achievement0"]))
+        self.assertEqual(InstanceSchema.objects.get(instance=self.instance).version, 1)
+        self.assertEqual(Stat.objects.filter(instance=self.instance).count(), 1)
+
+
+class SchedulerQueueTest(TrackingTestCase):
+    def setUp(self):
+        super().setUp()
+        other = GameInstance.objects.create(game=Game.objects.create(id=2, name="Other"), platform=self.platform, uid="2")
+        self.other = Achievement.objects.create(name="other", instance=other)
+
+        # Every user is due on both instances, the oldest rows first
+        due = tznow() - timedelta(hours=1)
+        for offset, user in enumerate(self.users):
+            for achievement in [*self.achievements, self.other]:
+                AchievementStatus.objects.create(user=user, achievement=achievement, refresh=due - timedelta(minutes=offset))
+
+        # The last user plays a board of the other instance, the first one of an instance they are due on elsewhere
+        board = AchievementBoard.objects.create(game=self.game, name="Board")
+        board.achievements.add(self.other)
+        AchievementBoardPlayer.objects.create(board=board, user=self.users[0], platform=self.platform)
+        AchievementBoardPlayer.objects.create(board=board, user=self.users[-1], platform=self.platform)
+        self.board_instance = other.id
+
+    def test_board_rows_come_first(self):
+        queue = Queue(read_size=100)
+        queue.refill()
+        first = queue.pop(2)
+        self.assertEqual(first, {(self.users[0].id, self.board_instance), (self.users[-1].id, self.board_instance)})
+        self.assertEqual(len(queue), 2 * len(self.users) - 2)
+
+    def test_refill_reads_rows_due_since(self):
+        queue = Queue(read_size=100)
+        # Board rows are read once per priority
+        rows = AchievementStatus.objects.count() + 2
+        self.assertEqual(queue.refill(), rows)
+
+        AchievementStatus.objects.filter(user=self.users[1], achievement=self.other).update(refresh=tznow())
+        self.assertEqual(queue.refill(), 1)
+
+        # Positions start over once a refill reads nothing
+        self.assertEqual(queue.refill(), 0)
+        self.assertEqual(queue.refill(), rows)
+        self.assertEqual(len(queue), 2 * len(self.users))
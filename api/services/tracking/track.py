@@ -1,48 +1,54 @@
-import requests
-from services.games.models import Platform
+from services.games.reference import platforms
+from . import steam
+from .steam import SteamError
 
-STEAM_KEY = "40414F4976621E15EBC72CD08991C04C"
-STEAM_BASE_URL = "https://api.steampowered.com/"
-STEAM_STATS_URL = "/ISteamUserStats/"
+STEAM_STATS_URL = "ISteamUserStats"
 
 # All available stats for an instance
 def stats_schema(instance):
-    if instance.platform == Platform.objects.get(name="Steam"):
-        # Fetch schema from Steam
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetSchemaForGame/v2?key={STEAM_KEY}&appid={instance.uid}")
-        game_data = response.json().get('game', {})
-        available_stats = game_data.get('availableGameStats', {}).get('stats', [])
-        return [{'displayname': stat.get('displayName'), 'name': stat.get('name')} for stat in available_stats]
-
-# Singular stat 
+    schema = game_schema(instance)
+    if schema is not None:
+        return schema['stats']
+
+# Singular stat
 def stat_value(statv, account):
 
     if not account:
         return None
 
-    if statv.stat.instance.platform == Platform.objects.get(name="Steam"):
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetUserStatsForGame/v2?key={STEAM_KEY}&appid={statv.stat.instance.uid}&steamid={account.uid}")
-        stats = response.json().get('playerstats', {}).get('stats', [])
-        stats_dict = {item['name']: item['value'] for item in stats}
-        return float(stats_dict.get(statv.stat.name))
+    if statv.stat.instance.platform_id == platforms.get(name="Steam").id:
+        try:
+            data = steam.client.get(STEAM_STATS_URL, "GetUserStatsForGame/v2", appid=statv.stat.instance.uid, steamid=account.uid)
+        except SteamError:
+            return None
+        stats = data.get('playerstats', {}).get('stats', [])
+        stats_dict = {item['name']: float(item['value']) for item in stats}
+        return stats_dict.get(statv.stat.name)
 
 # All available stat values
 def stat_values(instance, account):
-    if not account:
-        return None
-
-    if instance.platform == Platform.objects.get(name="Steam"): 
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetUserStatsForGame/v2?key={STEAM_KEY}&appid={instance.uid}&steamid={account.uid}")
-        stats = response.json().get('playerstats', {}).get('stats', [])
-        return {item['name']: float(item['value']) for item in stats}
+    snapshot = player_snapshot(instance, account)
+    if snapshot is not None:
+        return snapshot['stats']
 
 # Available achievements
 def achievements_schema(instance):
-    if instance.platform == Platform.objects.get(name="Steam"):
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetSchemaForGame/v2?key={STEAM_KEY}&appid={instance.uid}")
-        game_data = response.json().get('game', {})
-        available_achievements = game_data.get('availableGameStats', {}).get('achievements', [])
-        return [{'name': ach.get('name'), 'displayname': ach.get('displayName'), 'icon': ach.get('icon')} for ach in available_achievements]
+    schema = game_schema(instance)
+    if schema is not None:
+        return schema['achievements']
+
+# Game schema - stats and achievements from a single request
+def game_schema(instance):
+    if instance.platform_id == platforms.get(name="Steam").id:
+        try:
+            data = steam.client.get(STEAM_STATS_URL, "GetSchemaForGame/v2", appid=instance.uid)
+        except SteamError:
+            return None
+        game_data = data.get('game', {}).get('availableGameStats', {})
+        return {
+            'stats': [{'name': stat.get('name'), 'displayname': stat.get('displayName')} for stat in game_data.get('stats', [])],
+            'achievements': [{'name': ach.get('name'), 'displayname': ach.get('displayName'), 'icon': ach.get('icon')} for ach in game_data.get('achievements', [])],
+        }
 
 # Singular achievement status
 def achievement_status(achv, account):
@@ -50,19 +56,38 @@ def achievement_status(achv, account):
     if not account:
         return None
 
-    if achv.instance.platform == Platform.objects.get(name="Steam"):
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetUserStatsForGame/v2?key={STEAM_KEY}&appid={achv.instance.uid}&steamid={account.uid}")
-        achievements = response.json().get('playerstats', {}).get('achievements', [])
-        achievement = next((item for item in achievements if item['name'] == achv.name), None)
+    if achv.achievement.instance.platform_id == platforms.get(name="Steam").id:
+        try:
+            data = steam.client.get(STEAM_STATS_URL, "GetUserStatsForGame/v2", appid=achv.achievement.instance.uid, steamid=account.uid)
+        except SteamError:
+            return None
+        achievements = data.get('playerstats', {}).get('achievements', [])
+        achievement = next((item for item in achievements if item['name'] == achv.achievement.name), None)
         return bool(achievement.get('achieved')) if achievement else False
 
 # All achievement statuses
 def achievement_statuses(instance, account):
+    snapshot = player_snapshot(instance, account)
+    if snapshot is not None:
+        return snapshot['achievements']
+
+# Player snapshot - stats and achievement statuses from a single request
+def player_snapshot(instance, account):
 
     if not account:
         return None
 
-    if instance.platform == Platform.objects.get(name="Steam"):
-        response = requests.get(f"{STEAM_BASE_URL}{STEAM_STATS_URL}GetUserStatsForGame/v2?key={STEAM_KEY}&appid={instance.uid}&steamid={account.uid}")
-        achievements = response.json().get('playerstats', {}).get('achievements', [])
-        return {item['name']: bool(item['achieved']) for item in achievements}
+    if instance.platform_id == platforms.get(name="Steam").id:
+        return steam_snapshot(instance.uid, account.uid)
+
+# Steam player snapshot, makes no queries so it can be fetched from worker threads
+def steam_snapshot(appid, steamid):
+    try:
+        data = steam.client.get(STEAM_STATS_URL, "GetUserStatsForGame/v2", appid=appid, steamid=steamid)
+    except SteamError:
+        return None
+    playerstats = data.get('playerstats', {})
+    return {
+        'stats': {item['name']: float(item['value']) for item in playerstats.get('stats', [])},
+        'achievements': {item['name']: bool(item['achieved']) for item in playerstats.get('achievements', [])},
+    }
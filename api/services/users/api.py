@@ -31,7 +31,7 @@ def steam_link_url(request):
     params = {
         "openid.ns": "http://specs.openid.net/auth/2.0",
         "openid.mode": "checkid_setup",
-        "openid.return_to": f"{settings.SITE_URL}/api/users/accounts/steam/callback/?state={generate_token(request.auth, "authflow")}",
+        "openid.return_to": f"{settings.SITE_URL}/api/users/accounts/steam/callback/?state={generate_token(request.auth, 'authflow')}",
         "openid.realm": settings.SITE_URL,
         "openid.identity": "http://specs.openid.net/auth/2.0/identifier_select",
         "openid.claimed_id": "http://specs.openid.net/auth/2.0/identifier_select",
@@ -3,7 +3,7 @@ from django.contrib.auth.models import AbstractUser
 from services.games.models import Platform
 
 class User(AbstractUser):
-    pass
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.username
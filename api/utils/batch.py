@@ -0,0 +1,12 @@
+# Batch endpoint helpers
+
+# Ids of a comma separated list in request order without repeats, ValueError when
+# one is not an integer or there are more than `limit`
+def parse_ids(ids, limit):
+    try:
+        ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise ValueError("Ids must be comma separated integers.")
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids can be requested at once.")
+    return ids